@@ -2,12 +2,16 @@ from django.contrib import admin
 
 from .models import (
     Alert,
+    ConsumptionRate,
     Cuisine,
+    CuisineAvailability,
     Family,
     FamilyMember,
     Ingredient,
+    IngredientSubstitution,
     LowStockThreshold,
     Order,
+    PantryReservation,
     PantryStock,
     RecipeIngredient,
     ShoppingList,
@@ -29,10 +33,17 @@ class FamilyMemberAdmin(admin.ModelAdmin):
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
-    list_display = ["name", "created_at"]
+    list_display = ["name", "density", "created_at"]
     search_fields = ["name"]
 
 
+@admin.register(IngredientSubstitution)
+class IngredientSubstitutionAdmin(admin.ModelAdmin):
+    list_display = ["ingredient", "substitute", "ratio", "family", "created_at"]
+    list_filter = ["family"]
+    search_fields = ["ingredient__name", "substitute__name"]
+
+
 @admin.register(Cuisine)
 class CuisineAdmin(admin.ModelAdmin):
     list_display = ["name", "family", "default_time_min", "created_by", "created_at"]
@@ -40,6 +51,13 @@ class CuisineAdmin(admin.ModelAdmin):
     search_fields = ["name", "family__name"]
 
 
+@admin.register(CuisineAvailability)
+class CuisineAvailabilityAdmin(admin.ModelAdmin):
+    list_display = ["cuisine", "family", "is_available", "updated_at"]
+    list_filter = ["is_available", "family"]
+    search_fields = ["cuisine__name", "family__name"]
+
+
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 1
@@ -54,7 +72,7 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
 
 @admin.register(PantryStock)
 class PantryStockAdmin(admin.ModelAdmin):
-    list_display = ["family", "ingredient", "qty_available", "unit", "best_before", "updated_at"]
+    list_display = ["family", "ingredient", "qty_available", "qty_reserved", "unit", "best_before", "updated_at"]
     list_filter = ["family", "unit", "best_before"]
     search_fields = ["family__name", "ingredient__name"]
 
@@ -66,6 +84,20 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ["cuisine__name", "family__name", "created_by__username"]
 
 
+@admin.register(PantryReservation)
+class PantryReservationAdmin(admin.ModelAdmin):
+    list_display = ["order", "pantry_stock", "quantity", "created_at"]
+    list_filter = ["pantry_stock__family"]
+    search_fields = ["pantry_stock__ingredient__name", "pantry_stock__family__name"]
+
+
+@admin.register(ConsumptionRate)
+class ConsumptionRateAdmin(admin.ModelAdmin):
+    list_display = ["family", "ingredient", "decayed_usage", "unit", "updated_at"]
+    list_filter = ["family"]
+    search_fields = ["family__name", "ingredient__name"]
+
+
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
     list_display = ["family", "ingredient", "alert_type", "is_resolved", "created_at"]
@@ -0,0 +1,81 @@
+"""
+Alert resolution on pantry writes
+
+Alerts and the shopping list items they caused are closed in the transaction
+that replenishes the pantry, with bulk updates, instead of staying open until
+someone resolves them by hand. Alerts are created in the background by
+tasks.evaluate_pantry_alerts and the daily checks.
+"""
+
+from datetime import date, timedelta
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Alert, LowStockThreshold, PantryStock, ShoppingList
+from .units import convert
+
+# Items expiring within this many days get an EXPIRING_SOON alert
+EXPIRY_WARNING_DAYS = 3
+
+
+def resolve_replenished(family_id, ingredient_ids):
+    """
+    Resolve a family's open alerts on the given ingredients that no longer apply.
+
+    LOW_STOCK alerts are resolved once the stock is above the threshold or the
+    threshold is gone. EXPIRED alerts are resolved once the item is gone or its
+    best-before date is in the future, and EXPIRING_SOON alerts once it is gone
+    or no longer expires within the warning window. Open shopping list items for
+    ingredients that were replenished, and have no open alert left, are
+    resolved as well. Returns the number of alerts resolved.
+    """
+    today = date.today()
+    thresholds = {
+        ingredient_id: (threshold_qty, unit)
+        for ingredient_id, threshold_qty, unit in LowStockThreshold.objects.filter(
+            family_id=family_id, ingredient_id__in=ingredient_ids
+        ).values_list("ingredient_id", "threshold_qty", "unit")
+    }
+    stocks = {
+        ingredient_id: (qty_available, unit, best_before, density)
+        for ingredient_id, qty_available, unit, best_before, density in PantryStock.objects.filter(
+            family_id=family_id, ingredient_id__in=ingredient_ids
+        ).values_list("ingredient_id", "qty_available", "unit", "best_before", "ingredient__density")
+    }
+
+    stale = []
+    replenished = set()
+    for alert_id, ingredient_id, alert_type in Alert.objects.filter(
+        family_id=family_id, ingredient_id__in=ingredient_ids, is_resolved=False
+    ).values_list("pk", "ingredient_id", "alert_type"):
+        stock = stocks.get(ingredient_id)
+        if alert_type == "LOW_STOCK":
+            threshold = thresholds.get(ingredient_id)
+            if threshold is None:
+                stale.append(alert_id)
+            elif stock is not None:
+                threshold_qty = convert(threshold[0], threshold[1], stock[1], stock[3])
+                if threshold_qty is not None and stock[0] > threshold_qty:
+                    stale.append(alert_id)
+                    replenished.add(ingredient_id)
+        elif stock is None:
+            stale.append(alert_id)
+        else:
+            # A restock with a fresh date clears an EXPIRED alert even within the warning window
+            last_good_day = today if alert_type == "EXPIRED" else today + timedelta(days=EXPIRY_WARNING_DAYS)
+            if stock[2] is None or stock[2] > last_good_day:
+                stale.append(alert_id)
+                replenished.add(ingredient_id)
+
+    if not stale:
+        return 0
+
+    now = timezone.now()
+    resolved = Alert.objects.filter(pk__in=stale).update(is_resolved=True, resolved_at=now)
+    if replenished:
+        open_alerts = Alert.objects.filter(family=OuterRef("family"), ingredient=OuterRef("ingredient"), is_resolved=False)
+        ShoppingList.objects.filter(family_id=family_id, ingredient_id__in=replenished, resolved_at__isnull=True).exclude(
+            Exists(open_alerts)
+        ).update(resolved_at=now)
+    return resolved
@@ -0,0 +1,177 @@
+"""
+Menu availability engine
+
+Computes whether cuisines can be made from their family's pantry, and how
+many servings it allows, in a constant number of queries no matter how many
+cuisines or recipe ingredients are involved.
+"""
+
+from collections import defaultdict, namedtuple
+
+from .models import Cuisine, CuisineAvailability, PantryStock, RecipeIngredient
+from .substitutions import get_closures, ingredients_replaceable_by
+from .units import conversion_factor
+
+REBUILD_BATCH_SIZE = 500
+
+# Availability of a cuisine and how many portions the pantry allows (None if unlimited)
+CuisineStatus = namedtuple("CuisineStatus", ["is_available", "servings_possible"])
+
+
+def _cuisine_ids(cuisines):
+    """Accept cuisine instances or ids and return a list of ids"""
+    return [getattr(cuisine, "pk", cuisine) for cuisine in cuisines]
+
+
+def _portions(stock, quantity, unit, density):
+    """Return how many times a quantity fits in a pantry entry, or None if it never runs out"""
+    factor = conversion_factor(unit, stock[1], density) if stock is not None else None
+    if factor is None:
+        # Missing from the pantry or stocked in a unit that cannot be converted
+        return 0
+    if quantity <= 0:
+        return None
+    return int(stock[0] // (quantity * factor))
+
+
+def compute_menu_status(cuisines):
+    """
+    Return a {cuisine_id: CuisineStatus} mapping for the given cuisines.
+
+    Recipe ingredients are loaded in one query and the pantry of every
+    family owning those cuisines, less what open orders reserved, in a
+    second one. Each recipe row is then
+    converted to the pantry unit and divided by the matching pantry quantity
+    in a single in-memory pass; the servings of a cuisine are the minimum
+    over its required ingredients. Optional ingredients never limit a
+    cuisine, and substitutable ones fall back to the best substitute found
+    in the family's cached substitution closure.
+    """
+    cuisine_ids = _cuisine_ids(cuisines)
+    if not cuisine_ids:
+        return {}
+
+    # None means no ingredient limits the number of servings
+    servings = dict.fromkeys(cuisine_ids)
+
+    requirements = list(
+        RecipeIngredient.objects.filter(cuisine_id__in=cuisine_ids, is_optional=False).values_list(
+            "cuisine_id", "cuisine__family_id", "ingredient_id", "quantity", "unit", "ingredient__density", "is_substitutable"
+        )
+    )
+
+    family_ids = {requirement[1] for requirement in requirements}
+    pantry = defaultdict(dict)
+    if family_ids:
+        for family_id, ingredient_id, qty_available, qty_reserved, unit, density in PantryStock.objects.filter(
+            family_id__in=family_ids
+        ).values_list("family_id", "ingredient_id", "qty_available", "qty_reserved", "unit", "ingredient__density"):
+            # Quantities held by open orders are not available to new ones
+            pantry[family_id][ingredient_id] = (max(qty_available - qty_reserved, 0), unit, density)
+
+    substitutable_families = {requirement[1] for requirement in requirements if requirement[6]}
+    closures = get_closures(substitutable_families)
+
+    for cuisine_id, family_id, ingredient_id, quantity, unit, density, is_substitutable in requirements:
+        family_pantry = pantry[family_id]
+        portions = _portions(family_pantry.get(ingredient_id), quantity, unit, density)
+
+        if is_substitutable and portions is not None:
+            for substitute_id, ratio in closures[family_id].get(ingredient_id, ()):
+                stock = family_pantry.get(substitute_id)
+                if stock is None:
+                    continue
+                substitute_portions = _portions(stock, quantity * ratio, unit, stock[2])
+                if substitute_portions is None:
+                    portions = None
+                    break
+                portions = max(portions, substitute_portions)
+
+        if portions is None:
+            continue
+        current = servings[cuisine_id]
+        servings[cuisine_id] = portions if current is None else min(current, portions)
+
+    return {cuisine_id: CuisineStatus(portions is None or portions > 0, portions) for cuisine_id, portions in servings.items()}
+
+
+def compute_availability(cuisines):
+    """Return a {cuisine_id: is_available} mapping for the given cuisines"""
+    return {cuisine_id: status.is_available for cuisine_id, status in compute_menu_status(cuisines).items()}
+
+
+def refresh_availability(cuisines):
+    """
+    Recompute and persist CuisineAvailability rows for the given cuisines.
+
+    Cuisines that no longer exist are ignored. Returns the number of rows
+    written.
+    """
+    cuisine_ids = _cuisine_ids(cuisines)
+    if not cuisine_ids:
+        return 0
+
+    families = dict(Cuisine.objects.filter(pk__in=cuisine_ids).values_list("pk", "family_id"))
+    statuses = compute_menu_status(families)
+    rows = [
+        CuisineAvailability(
+            family_id=family_id,
+            cuisine_id=cuisine_id,
+            is_available=statuses[cuisine_id].is_available,
+            servings_possible=statuses[cuisine_id].servings_possible,
+        )
+        for cuisine_id, family_id in families.items()
+    ]
+    CuisineAvailability.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["cuisine"],
+        update_fields=["is_available", "servings_possible", "updated_at"],
+    )
+    return len(rows)
+
+
+def refresh_availability_for_ingredients(family_id, ingredient_ids):
+    """Recompute availability only for the family's cuisines that use, or can substitute, the given ingredients"""
+    ingredient_ids = set(ingredient_ids)
+    ingredient_ids |= ingredients_replaceable_by(get_closures([family_id])[family_id], ingredient_ids)
+    cuisine_ids = (
+        RecipeIngredient.objects.filter(cuisine__family_id=family_id, ingredient_id__in=ingredient_ids)
+        .values_list("cuisine_id", flat=True)
+        .distinct()
+    )
+    return refresh_availability(list(cuisine_ids))
+
+
+def refresh_availability_for_all_families(ingredient_ids):
+    """Recompute availability of every family's cuisines that use the given ingredients"""
+    cuisine_ids = (
+        RecipeIngredient.objects.filter(ingredient_id__in=ingredient_ids)
+        .order_by("cuisine_id")
+        .values_list("cuisine_id", flat=True)
+        .distinct()
+    )
+    rows = 0
+    batch = []
+    for cuisine_id in cuisine_ids.iterator(chunk_size=REBUILD_BATCH_SIZE):
+        batch.append(cuisine_id)
+        if len(batch) == REBUILD_BATCH_SIZE:
+            rows += refresh_availability(batch)
+            batch = []
+    return rows + refresh_availability(batch)
+
+
+def iter_cuisine_batches(family_ids=None):
+    """Yield lists of cuisine ids in batches, optionally limited to some families"""
+    cuisines = Cuisine.objects.order_by("pk")
+    if family_ids:
+        cuisines = cuisines.filter(family_id__in=family_ids)
+
+    batch = []
+    for cuisine_id in cuisines.values_list("pk", flat=True).iterator(chunk_size=REBUILD_BATCH_SIZE):
+        batch.append(cuisine_id)
+        if len(batch) == REBUILD_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,141 @@
+"""
+Consumption forecasting
+
+A family's usage of an ingredient is kept as one exponentially decayed total
+per ingredient in ConsumptionRate: completing an order decays the stored
+total by the time since its last update and adds the amounts used, a
+constant amount of work per order. With a half-life of H days, steady usage
+of r per day makes the total converge to r * H / ln 2, so the daily rate is
+read back as total * ln 2 / H after decaying it to the current time.
+
+Rates project when the pantry runs out and size generated shopping list
+items for SHOPPING_FORECAST_DAYS.
+"""
+
+import math
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ConsumptionRate, PantryStock
+from .units import convert
+
+RATE_STEP = Decimal("0.0001")
+# Stock lasting longer than this is reported without a stock-out date
+FORECAST_MAX_DAYS = 3650
+
+
+def _half_life_days():
+    return getattr(settings, "CONSUMPTION_HALF_LIFE_DAYS", 14)
+
+
+def _decay(since, now):
+    """Return the factor a total recorded at `since` has decayed by at `now`"""
+    age_days = max((now - since).total_seconds(), 0) / 86400
+    return Decimal(math.exp(-math.log(2) * age_days / _half_life_days()))
+
+
+def daily_rate(decayed_usage, updated_at, now=None):
+    """Return the daily consumption rate for a stored total, in the total's unit"""
+    now = now or timezone.now()
+    rate = decayed_usage * _decay(updated_at, now) * Decimal(math.log(2) / _half_life_days())
+    return rate.quantize(RATE_STEP, ROUND_HALF_UP)
+
+
+def forecast_quantity(rate, unit, target_unit, density):
+    """Return the consumption over SHOPPING_FORECAST_DAYS in another unit, or None if it cannot be converted"""
+    if rate is None:
+        return None
+    days = getattr(settings, "SHOPPING_FORECAST_DAYS", 7)
+    return convert(rate * days, unit, target_unit, density)
+
+
+def record_usage(family_id, usage, now=None):
+    """
+    Fold amounts used by a completed order into the family's consumption rates.
+
+    usage maps ingredient ids to (amount, unit, density) tuples. Each stored
+    total is decayed to now before the amount is added, converted to the
+    unit of the total; totals in an incompatible unit start over. Called
+    while the pantry rows of the ingredients are locked, so updates of one
+    family's rates do not interleave.
+    """
+    now = now or timezone.now()
+    rates = {
+        rate.ingredient_id: rate
+        for rate in ConsumptionRate.objects.filter(family_id=family_id, ingredient_id__in=usage).select_for_update()
+    }
+
+    rows = []
+    for ingredient_id, (amount, unit, density) in usage.items():
+        rate = rates.get(ingredient_id)
+        previous = convert(rate.decayed_usage, rate.unit, unit, density) if rate is not None else None
+        if previous is not None:
+            amount += previous * _decay(rate.updated_at, now)
+        rows.append(
+            ConsumptionRate(
+                family_id=family_id,
+                ingredient_id=ingredient_id,
+                decayed_usage=amount.quantize(RATE_STEP, ROUND_HALF_UP),
+                unit=unit,
+                updated_at=now,
+            )
+        )
+
+    ConsumptionRate.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["family", "ingredient"],
+        update_fields=["decayed_usage", "unit", "updated_at"],
+    )
+
+
+def forecast_pantry(family_ids):
+    """
+    Return the projected stock-out of the pantry items of the given families.
+
+    Items are dicts with the daily rate in the pantry unit, the days the free
+    stock lasts at that rate and the date it runs out; both are None for
+    ingredients without usage history or lasting over FORECAST_MAX_DAYS. Sorted by family and ingredient name.
+    """
+    now = timezone.now()
+    rates = {
+        (family_id, ingredient_id): (decayed_usage, unit, updated_at)
+        for family_id, ingredient_id, decayed_usage, unit, updated_at in ConsumptionRate.objects.filter(
+            family_id__in=family_ids
+        ).values_list("family_id", "ingredient_id", "decayed_usage", "unit", "updated_at")
+    }
+
+    items = []
+    for family_id, ingredient_id, name, density, qty_available, qty_reserved, unit in (
+        PantryStock.objects.filter(family_id__in=family_ids)
+        .order_by("family_id", "ingredient__name")
+        .values_list(
+            "family_id", "ingredient_id", "ingredient__name", "ingredient__density", "qty_available", "qty_reserved", "unit"
+        )
+    ):
+        qty_free = max(qty_available - qty_reserved, Decimal(0))
+        rate = None
+        if (family_id, ingredient_id) in rates:
+            decayed_usage, rate_unit, updated_at = rates[(family_id, ingredient_id)]
+            rate = convert(daily_rate(decayed_usage, updated_at, now), rate_unit, unit, density)
+
+        days_left = (qty_free / rate).quantize(Decimal("0.1"), ROUND_HALF_UP) if rate else None
+        if days_left is not None and days_left > FORECAST_MAX_DAYS:
+            # Usage has all but decayed away; there is no meaningful stock-out to project
+            days_left = None
+        items.append(
+            {
+                "family_id": family_id,
+                "ingredient_id": ingredient_id,
+                "ingredient_name": name,
+                "unit": unit,
+                "qty_available": qty_free,
+                "daily_rate": rate.quantize(RATE_STEP, ROUND_HALF_UP) if rate is not None else None,
+                "days_left": days_left,
+                "stock_out_date": (now + timedelta(days=float(days_left))).date() if days_left is not None else None,
+            }
+        )
+    return items
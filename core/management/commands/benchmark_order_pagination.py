@@ -0,0 +1,97 @@
+import statistics
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import Cuisine, Family, FamilyMember, Order
+from core.views import OrderViewSet
+
+BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = "Compare page-number and cursor pagination of the order history at increasing depths"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=1_000_000, help="Number of orders to create")
+        parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 10000, 50000], help="Page numbers to measure")
+        parser.add_argument("--repeat", type=int, default=5, help="Requests per measurement")
+
+    def handle(self, *args, **options):
+        page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+        pages = [page for page in options["pages"] if (page - 1) * page_size < options["orders"]]
+
+        # Everything runs in a transaction that is rolled back, so no benchmark data is left behind
+        with transaction.atomic():
+            user, family = self._seed(options["orders"])
+            self.stdout.write(f"{'page':>8} {'page number':>22} {'cursor':>22}")
+            for page in pages:
+                by_number = self._measure(user, {"page": page}, options["repeat"])
+                by_cursor = self._measure(user, self._cursor_params(family, page, page_size), options["repeat"])
+                self.stdout.write(f"{page:>8} {by_number:>22} {by_cursor:>22}")
+            transaction.set_rollback(True)
+
+    def _seed(self, count):
+        user = User.objects.create_user(username="pagination-benchmark")
+        family = Family.objects.create(name="Pagination benchmark")
+        FamilyMember.objects.create(user=user, family=family, role="admin")
+        cuisine = Cuisine.objects.create(name="Benchmark dish", default_time_min=1, created_by=user, family=family)
+
+        # Give every order its own timestamp, like a real history, instead of the insert time
+        created_at = Order._meta.get_field("created_at")
+        created_at.auto_now_add = False
+        try:
+            start = timezone.now() - timedelta(seconds=count)
+            for offset in range(0, count, BATCH_SIZE):
+                Order.objects.bulk_create(
+                    Order(
+                        family=family,
+                        cuisine=cuisine,
+                        created_by=user,
+                        status="DONE",
+                        created_at=start + timedelta(seconds=index),
+                    )
+                    for index in range(offset, min(offset + BATCH_SIZE, count))
+                )
+        finally:
+            created_at.auto_now_add = True
+
+        self.stdout.write(f"Created {count} orders")
+        return user, family
+
+    def _cursor_params(self, family, page, page_size):
+        """Return the query parameters of the cursor link a client would follow to reach a page"""
+        if page == 1:
+            return {"pagination": "cursor"}
+
+        paginator = OrderViewSet.cursor_pagination_class()
+        paginator.base_url = "/api/orders/"
+        # Cursors point past the last row of the previous page
+        previous = Order.objects.filter(family=family).order_by(*paginator.ordering)[(page - 1) * page_size - 1]
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(previous.created_at)))
+        return dict(pair.split("=", 1) for pair in urlsplit(url).query.split("&"))
+
+    def _measure(self, user, params, repeat):
+        view = OrderViewSet.as_view({"get": "list"})
+        host = next((host for host in settings.ALLOWED_HOSTS if not host.startswith((".", "*"))), "localhost")
+        timings = []
+        for _ in range(repeat):
+            request = APIRequestFactory().get("/api/orders/", params, HTTP_HOST=host)
+            force_authenticate(request, user=user)
+            # The query log is capped, start from an empty one so the count stays accurate
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = view(request)
+                response.render()
+                timings.append((time.perf_counter() - start) * 1000)
+        return f"{statistics.median(timings):.1f} ms / {len(queries)} queries"
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.availability import CuisineStatus, compute_menu_status, iter_cuisine_batches, refresh_availability
+from core.models import CuisineAvailability
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed cuisine availability table, or check it for drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report cuisines whose stored availability differs from a fresh computation",
+        )
+        parser.add_argument("--family", type=int, action="append", dest="families", help="Limit to a family id")
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            self._check(options["families"])
+        else:
+            self._rebuild(options["families"])
+
+    def _rebuild(self, family_ids):
+        rows = 0
+        for cuisine_ids in iter_cuisine_batches(family_ids):
+            rows += refresh_availability(cuisine_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt availability for {rows} cuisines"))
+
+    def _check(self, family_ids):
+        checked = 0
+        drifted = []
+        for cuisine_ids in iter_cuisine_batches(family_ids):
+            expected = compute_menu_status(cuisine_ids)
+            stored = {
+                cuisine_id: CuisineStatus(is_available, servings_possible)
+                for cuisine_id, is_available, servings_possible in CuisineAvailability.objects.filter(
+                    cuisine_id__in=cuisine_ids
+                ).values_list("cuisine_id", "is_available", "servings_possible")
+            }
+            checked += len(cuisine_ids)
+            drifted += [cuisine_id for cuisine_id in cuisine_ids if stored.get(cuisine_id) != expected[cuisine_id]]
+
+        if drifted:
+            preview = ", ".join(str(cuisine_id) for cuisine_id in drifted[:20])
+            raise CommandError(f"{len(drifted)} of {checked} cuisines have drifted (ids: {preview})")
+        self.stdout.write(self.style.SUCCESS(f"No drift found in {checked} cuisines"))
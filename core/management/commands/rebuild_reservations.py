@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.pantry import repair_reserved_totals, reserved_total_drift
+
+
+class Command(BaseCommand):
+    help = "Repair PantryStock.qty_reserved totals from the reservation rows, or check them for drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report pantry rows whose qty_reserved differs from the sum of their reservations",
+        )
+        parser.add_argument("--family", type=int, action="append", dest="families", help="Limit to a family id")
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            self._check(options["families"])
+        else:
+            repaired = repair_reserved_totals(options["families"])
+            self.stdout.write(self.style.SUCCESS(f"Repaired qty_reserved of {repaired} pantry items"))
+
+    def _check(self, family_ids):
+        drifted = reserved_total_drift(family_ids)
+        if drifted:
+            preview = ", ".join(
+                f"{stock_id} ({stored} != {expected})" for stock_id, (stored, expected) in list(drifted.items())[:20]
+            )
+            raise CommandError(f"{len(drifted)} pantry items have drifted reserved totals (ids: {preview})")
+        self.stdout.write(self.style.SUCCESS("No drift found in reserved totals"))
@@ -0,0 +1,104 @@
+"""
+Cache of fully serialized /api/menu/ payloads
+
+Payloads are stored in the default cache (Redis outside of tests) under a key
+made of the user's families, their cache generations and the request's query
+string. Writes that change a family's menu bump its generation once they are
+committed, so stale payloads are never read again and simply expire.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+HITS_KEY = "menu_cache:hits"
+MISSES_KEY = "menu_cache:misses"
+GLOBAL_GENERATION_KEY = "menu_cache:generation:all"
+
+
+def _generation_key(family_id):
+    return f"menu_cache:generation:{family_id}"
+
+
+def _incr(key):
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The key was evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def get_cache_key(family_ids, request):
+    """Return the cache key for a menu request, or None if the user has no family"""
+    family_ids = sorted(family_ids)
+    if not family_ids:
+        return None
+
+    generation_keys = [GLOBAL_GENERATION_KEY] + [_generation_key(family_id) for family_id in family_ids]
+    generations = cache.get_many(generation_keys)
+    families = "-".join(f"{family_id}.{generations.get(_generation_key(family_id), 0)}" for family_id in family_ids)
+
+    # Pagination links are absolute, so the host is part of the payload
+    query = "&".join(f"{name}={value}" for name, values in sorted(request.GET.lists()) for value in values)
+    variant = hashlib.md5(
+        f"{request.get_host()}|{request.accepted_renderer.format}|{query}".encode(), usedforsecurity=False
+    ).hexdigest()
+    return f"menu_cache:payload:{generations.get(GLOBAL_GENERATION_KEY, 0)}:{families}:{variant}"
+
+
+def get_payload(key):
+    """Return the cached payload for a key and record the hit or miss"""
+    payload = cache.get(key)
+    _incr(MISSES_KEY if payload is None else HITS_KEY)
+    return payload
+
+
+def set_payload(key, payload):
+    cache.set(key, payload, timeout=getattr(settings, "MENU_CACHE_TIMEOUT", 300))
+
+
+def invalidate_family(family_id):
+    """Make every cached menu payload that includes the family unreachable"""
+    _incr(_generation_key(family_id))
+
+
+def invalidate_all():
+    """Make every cached menu payload unreachable, for changes to data shared by all families"""
+    _incr(GLOBAL_GENERATION_KEY)
+
+
+def get_stats():
+    """Return the hit and miss counters and the resulting hit rate"""
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else None}
+
+
+class MenuCacheMixin:
+    """
+    Serve list responses from the serialized payload cache, skipping the serializer on hits.
+
+    Views implement get_cache_family_ids() to return the families whose
+    data the response contains.
+    """
+
+    def list(self, request, *args, **kwargs):
+        family_ids = self.get_cache_family_ids()
+        key = get_cache_key(family_ids, request)
+        if key is None:
+            return super().list(request, *args, **kwargs)
+
+        payload = get_payload(key)
+        if payload is not None:
+            return Response(payload)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_payload(key, response.data)
+        return response
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_shoppinglist"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CuisineAvailability",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("is_available", models.BooleanField(default=False)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "cuisine",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="availability", to="core.cuisine"
+                    ),
+                ),
+                ("family", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.family")),
+            ],
+            options={
+                "verbose_name_plural": "cuisine availability",
+                "unique_together": {("family", "cuisine")},
+            },
+        ),
+    ]
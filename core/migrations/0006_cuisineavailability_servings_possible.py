@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_cuisineavailability"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cuisineavailability",
+            name="servings_possible",
+            field=models.PositiveIntegerField(blank=True, help_text="Empty when stock does not limit it", null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_cuisineavailability_servings_possible"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingredient",
+            name="density",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=4,
+                help_text="Grams per millilitre, used to convert between mass and volume units",
+                max_digits=10,
+                null=True,
+            ),
+        ),
+    ]
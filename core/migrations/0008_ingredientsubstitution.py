@@ -0,0 +1,55 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_ingredient_density"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngredientSubstitution",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "ratio",
+                    models.DecimalField(
+                        decimal_places=4,
+                        default=1,
+                        help_text="Quantity of the substitute that replaces one unit of the ingredient",
+                        max_digits=10,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "family",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Leave empty to apply to every family",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="core.family",
+                    ),
+                ),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="substitutions", to="core.ingredient"
+                    ),
+                ),
+                (
+                    "substitute",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="substitute_for", to="core.ingredient"
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("ingredient", "substitute", "family")},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_ingredientsubstitution"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FamilyDataVersion",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "resource",
+                    models.CharField(choices=[("menu", "Menu"), ("orders", "Orders"), ("pantry", "Pantry")], max_length=20),
+                ),
+                ("version", models.PositiveBigIntegerField(default=0)),
+                ("family", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.family")),
+            ],
+            options={
+                "unique_together": {("family", "resource")},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_familydataversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="stock_deducted_at",
+            field=models.DateTimeField(
+                blank=True, help_text="When the used ingredients were deducted from the pantry", null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_order_stock_deducted_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pantrystock",
+            name="qty_reserved",
+            field=models.DecimalField(
+                decimal_places=2, default=0, help_text="Running total held by open orders' reservations", max_digits=10
+            ),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="status",
+            field=models.CharField(
+                choices=[("NEW", "New"), ("COOKING", "Cooking"), ("DONE", "Done"), ("CANCELLED", "Cancelled")],
+                default="NEW",
+                max_length=20,
+            ),
+        ),
+        migrations.CreateModel(
+            name="PantryReservation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("quantity", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="reservations", to="core.order"
+                    ),
+                ),
+                (
+                    "pantry_stock",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="reservations", to="core.pantrystock"
+                    ),
+                ),
+            ],
+        ),
+    ]
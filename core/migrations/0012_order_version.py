@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_pantryreservation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="version",
+            field=models.PositiveIntegerField(default=0, help_text="Incremented on every status change"),
+        ),
+    ]
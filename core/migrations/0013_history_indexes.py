@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_order_version"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alert",
+            index=models.Index(fields=["family", "created_at", "id"], name="core_alert_family__98e13c_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["family", "created_at", "id"], name="core_order_family__9415f8_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["family", "status", "created_at"], name="core_order_family__a04c01_idx"),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_history_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("NEW", "New"),
+                    ("READY", "Ready to cook"),
+                    ("COOKING", "Cooking"),
+                    ("DONE", "Done"),
+                    ("CANCELLED", "Cancelled"),
+                ],
+                default="NEW",
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("status", "NEW")), fields=["scheduled_for"], name="core_order_scheduled_new_idx"
+            ),
+        ),
+    ]
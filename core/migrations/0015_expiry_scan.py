@@ -0,0 +1,26 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_order_ready_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="alert",
+            name="alert_type",
+            field=models.CharField(
+                choices=[("LOW_STOCK", "Low Stock"), ("EXPIRED", "Expired"), ("EXPIRING_SOON", "Expiring Soon")], max_length=20
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pantrystock",
+            index=models.Index(
+                condition=models.Q(("best_before__isnull", False)), fields=["best_before"], name="core_pantry_best_before_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:21
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+from django.utils import timezone
+
+
+def resolve_duplicate_open_alerts(apps, schema_editor):
+    """Keep only the newest open alert of each type per ingredient before the constraint is added"""
+    Alert = apps.get_model("core", "Alert")
+    duplicates = (
+        Alert.objects.filter(is_resolved=False)
+        .values("family_id", "ingredient_id", "alert_type")
+        .annotate(count=Count("pk"), newest=Max("pk"))
+        .filter(count__gt=1)
+    )
+    now = timezone.now()
+    for duplicate in duplicates:
+        Alert.objects.filter(
+            family_id=duplicate["family_id"],
+            ingredient_id=duplicate["ingredient_id"],
+            alert_type=duplicate["alert_type"],
+            is_resolved=False,
+        ).exclude(pk=duplicate["newest"]).update(is_resolved=True, resolved_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0015_expiry_scan"),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_duplicate_open_alerts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="alert",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_resolved", False)),
+                fields=("family", "ingredient", "alert_type"),
+                name="core_alert_unique_open",
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0016_alert_unique_open"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConsumptionRate",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "decayed_usage",
+                    models.DecimalField(
+                        decimal_places=4,
+                        help_text="Usage so far, each amount decayed by its age as of updated_at",
+                        max_digits=14,
+                    ),
+                ),
+                ("unit", models.CharField(max_length=20)),
+                ("updated_at", models.DateTimeField()),
+                ("family", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.family")),
+                ("ingredient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.ingredient")),
+            ],
+            options={
+                "unique_together": {("family", "ingredient")},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def backfill_cuisine_availability(apps, schema_editor):
+    """Compute the availability rows of cuisines created before the table was kept up to date"""
+    # The rules live in core.availability (units, reservations, substitutions), which works on the current models
+    from core.availability import refresh_availability
+
+    Cuisine = apps.get_model("core", "Cuisine")
+    missing = list(Cuisine.objects.filter(availability__isnull=True).order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(missing), BATCH_SIZE):
+        refresh_availability(missing[start : start + BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0017_consumptionrate"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_cuisine_availability, migrations.RunPython.noop),
+    ]
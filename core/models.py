@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import User
 from django.db import models
 
@@ -44,12 +46,43 @@ class Ingredient(models.Model):
 
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    density = models.DecimalField(
+        max_digits=10,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        help_text="Grams per millilitre, used to convert between mass and volume units",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.name
 
 
+class IngredientSubstitution(models.Model):
+    """Ingredient that can replace another one in recipes, for one family or for everyone"""
+
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name="substitutions")
+    substitute = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name="substitute_for")
+    ratio = models.DecimalField(
+        max_digits=10,
+        decimal_places=4,
+        default=1,
+        help_text="Quantity of the substitute that replaces one unit of the ingredient",
+    )
+    family = models.ForeignKey(
+        Family, on_delete=models.CASCADE, null=True, blank=True, help_text="Leave empty to apply to every family"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ["ingredient", "substitute", "family"]
+
+    def __str__(self):
+        scope = self.family.name if self.family_id else "all families"
+        return f"{self.substitute.name} replaces {self.ingredient.name} x{self.ratio} ({scope})"
+
+
 class Cuisine(models.Model):
     """Recipe/dish that can be cooked"""
 
@@ -69,27 +102,27 @@ class Cuisine(models.Model):
 
     def is_available(self):
         """Check if this cuisine can be made with current pantry stock"""
-        for recipe_ingredient in self.recipe_ingredients.all():
-            if recipe_ingredient.is_optional:
-                continue
+        from .availability import compute_availability
 
-            try:
-                pantry_stock = PantryStock.objects.get(family=self.family, ingredient=recipe_ingredient.ingredient)
+        return compute_availability([self])[self.pk]
 
-                # Simple unit comparison - assumes same units for now
-                # TODO: Add unit conversion logic
-                if pantry_stock.qty_available < recipe_ingredient.quantity:
-                    # Check if there's a substitutable ingredient available
-                    if not recipe_ingredient.is_substitutable:
-                        return False
-                    # TODO: Add substitution logic
 
-            except PantryStock.DoesNotExist:
-                if not recipe_ingredient.is_substitutable:
-                    return False
-                # TODO: Add substitution logic
+class CuisineAvailability(models.Model):
+    """Precomputed availability of a cuisine, kept up to date as pantry and recipes change"""
+
+    family = models.ForeignKey(Family, on_delete=models.CASCADE)
+    cuisine = models.OneToOneField(Cuisine, on_delete=models.CASCADE, related_name="availability")
+    is_available = models.BooleanField(default=False)
+    servings_possible = models.PositiveIntegerField(null=True, blank=True, help_text="Empty when stock does not limit it")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ["family", "cuisine"]
+        verbose_name_plural = "cuisine availability"
 
-        return True
+    def __str__(self):
+        status = "Available" if self.is_available else "Unavailable"
+        return f"{self.cuisine.name} ({status})"
 
 
 class RecipeIngredient(models.Model):
@@ -115,6 +148,9 @@ class PantryStock(models.Model):
     family = models.ForeignKey(Family, on_delete=models.CASCADE)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
     qty_available = models.DecimalField(max_digits=10, decimal_places=2)
+    qty_reserved = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, help_text="Running total held by open orders' reservations"
+    )
     unit = models.CharField(max_length=20)
     best_before = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -122,31 +158,82 @@ class PantryStock(models.Model):
 
     class Meta:
         unique_together = ["family", "ingredient"]
+        indexes = [
+            # Expiry scan; most pantry items have no best-before date
+            models.Index(
+                fields=["best_before"], condition=models.Q(best_before__isnull=False), name="core_pantry_best_before_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.family.name}: {self.qty_available} {self.unit} {self.ingredient.name}"
 
+    def save(self, *args, **kwargs):
+        # qty_reserved is a running total kept by core.pantry with UPDATEs; never write back a value loaded earlier
+        if not self._state.adding and not kwargs.get("force_insert") and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != "qty_reserved"
+            ]
+        super().save(*args, **kwargs)
+
 
 class Order(models.Model):
     """Order placed by family member for a specific cuisine"""
 
     STATUS_CHOICES = [
         ("NEW", "New"),
+        ("READY", "Ready to cook"),
         ("COOKING", "Cooking"),
         ("DONE", "Done"),
+        ("CANCELLED", "Cancelled"),
     ]
+    # Orders whose ingredients are still to be used
+    OPEN_STATUSES = ["NEW", "READY", "COOKING"]
+    # Status changes allowed from each status; NEW -> READY is made by the scheduled-order dispatcher
+    TRANSITIONS = {
+        "NEW": ["READY", "COOKING", "CANCELLED"],
+        "READY": ["COOKING", "CANCELLED"],
+        "COOKING": ["DONE", "CANCELLED"],
+        "DONE": [],
+        "CANCELLED": [],
+    }
 
     family = models.ForeignKey(Family, on_delete=models.CASCADE)
     cuisine = models.ForeignKey(Cuisine, on_delete=models.CASCADE)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="NEW")
     scheduled_for = models.DateTimeField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0, help_text="Incremented on every status change")
+    stock_deducted_at = models.DateTimeField(
+        null=True, blank=True, help_text="When the used ingredients were deducted from the pantry"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Cursor pagination of a family's order history
+            models.Index(fields=["family", "created_at", "id"]),
+            # Open orders of a family, e.g. for the prep list and the chef board
+            models.Index(fields=["family", "status", "created_at"]),
+            # Scheduled orders still waiting for the dispatcher
+            models.Index(fields=["scheduled_for"], condition=models.Q(status="NEW"), name="core_order_scheduled_new_idx"),
+        ]
+
     def __str__(self):
         return f"Order #{self.id}: {self.cuisine.name} for {self.family.name} ({self.status})"
 
+    @property
+    def cook_at(self):
+        """When cooking has to start for the order to be ready at its scheduled time"""
+        if self.scheduled_for is None:
+            return None
+        return self.scheduled_for - timedelta(minutes=self.cuisine.default_time_min)
+
+    def can_transition_to(self, status):
+        """Check whether the order may move from its current status to the given one"""
+        return status in self.TRANSITIONS[self.status]
+
 
 class OrderItemIngredient(models.Model):
     """Snapshot of ingredients used in an order for historical accuracy"""
@@ -160,12 +247,45 @@ class OrderItemIngredient(models.Model):
         return f"Order #{self.order.id}: {self.quantity} {self.unit} {self.ingredient.name}"
 
 
+class PantryReservation(models.Model):
+    """Pantry quantity held for an open order, in the unit the pantry is stocked in"""
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="reservations")
+    pantry_stock = models.ForeignKey(PantryStock, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Order #{self.order_id}: {self.quantity} {self.pantry_stock.unit} {self.pantry_stock.ingredient.name}"
+
+
+class FamilyDataVersion(models.Model):
+    """Monotonic version of a family's resource, bumped on every write that changes it"""
+
+    RESOURCES = [
+        ("menu", "Menu"),
+        ("orders", "Orders"),
+        ("pantry", "Pantry"),
+    ]
+
+    family = models.ForeignKey(Family, on_delete=models.CASCADE)
+    resource = models.CharField(max_length=20, choices=RESOURCES)
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["family", "resource"]
+
+    def __str__(self):
+        return f"{self.family.name} {self.resource} v{self.version}"
+
+
 class Alert(models.Model):
     """Alerts for low stock and expired ingredients"""
 
     ALERT_TYPES = [
         ("LOW_STOCK", "Low Stock"),
         ("EXPIRED", "Expired"),
+        ("EXPIRING_SOON", "Expiring Soon"),
     ]
 
     family = models.ForeignKey(Family, on_delete=models.CASCADE)
@@ -181,6 +301,15 @@ class Alert(models.Model):
         indexes = [
             models.Index(fields=["family", "is_resolved"]),
             models.Index(fields=["alert_type", "is_resolved"]),
+            models.Index(fields=["family", "created_at", "id"]),
+        ]
+        constraints = [
+            # At most one open alert of each type per ingredient
+            models.UniqueConstraint(
+                fields=["family", "ingredient", "alert_type"],
+                condition=models.Q(is_resolved=False),
+                name="core_alert_unique_open",
+            ),
         ]
 
     def __str__(self):
@@ -230,3 +359,21 @@ class ShoppingList(models.Model):
     def __str__(self):
         status = "Resolved" if self.is_resolved else "Pending"
         return f"{self.family.name} - {self.qty_needed} {self.unit} {self.ingredient.name} ({status})"
+
+
+class ConsumptionRate(models.Model):
+    """Exponentially weighted usage of an ingredient by a family, from its completed orders"""
+
+    family = models.ForeignKey(Family, on_delete=models.CASCADE)
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    decayed_usage = models.DecimalField(
+        max_digits=14, decimal_places=4, help_text="Usage so far, each amount decayed by its age as of updated_at"
+    )
+    unit = models.CharField(max_length=20)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ["family", "ingredient"]
+
+    def __str__(self):
+        return f"{self.family.name} - {self.ingredient.name}: {self.decayed_usage} {self.unit}"
@@ -0,0 +1,48 @@
+"""
+Pagination for history lists
+
+Page numbers stay the default. Clients that ask for ?pagination=cursor, or
+follow a cursor link, get DRF's cursor pagination instead, ordered by
+(created_at, id). It skips the COUNT(*), and the cursor only filters on
+created_at, so the page starts at the last timestamp seen rather than at an
+OFFSET from the top of the history. Rows sharing that timestamp are skipped
+with a small offset kept in the cursor, id only makes the order stable. The
+family filter should be an equality so a (family, created_at, id) index can
+serve the page in order.
+"""
+
+from rest_framework.pagination import CursorPagination
+
+from .models import FamilyMember
+
+
+class HistoryCursorPagination(CursorPagination):
+    ordering = ("-created_at", "-id")
+
+
+class OptionalCursorPaginationMixin:
+    """Let list views switch to cursor pagination on request"""
+
+    cursor_pagination_class = HistoryCursorPagination
+    pagination_mode_query_param = "pagination"
+
+    def _wants_cursor(self):
+        params = self.request.query_params
+        return (
+            params.get(self.pagination_mode_query_param) == "cursor"
+            or self.cursor_pagination_class.cursor_query_param in params
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator") and self._wants_cursor():
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+    def filter_user_families(self, queryset):
+        """Limit a history queryset to the requesting user's families"""
+        family_ids = list(FamilyMember.objects.filter(user=self.request.user).values_list("family_id", flat=True))
+        if len(family_ids) == 1:
+            # The common case, which walks the (family, created_at, id) index without sorting
+            return queryset.filter(family_id=family_ids[0])
+        return queryset.filter(family_id__in=family_ids)
@@ -0,0 +1,362 @@
+"""
+Pantry stock movements and requirements
+
+New orders reserve their ingredients: a PantryReservation row is written per
+order and stocked ingredient, on a substitute when a substitutable ingredient
+is short, and the running PantryStock.qty_reserved total is adjusted in the
+same transaction so availability reads free stock without summing
+reservations. Completing an order releases its reservations,
+deducts what it used and records the usage for consumption forecasts;
+cancelling or deleting it only releases them.
+
+Stock rows are updated with a single UPDATE using database-side arithmetic,
+after locking them, so concurrent orders never lose updates.
+
+The running totals can be checked against the reservation rows and repaired
+with the rebuild_reservations management command.
+
+The prep list sums what open orders still need with one GROUP BY and puts it
+next to the current pantry levels.
+"""
+
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, Exists, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .availability import refresh_availability_for_ingredients
+from .forecast import record_usage
+from .models import Order, OrderItemIngredient, PantryReservation, PantryStock, RecipeIngredient
+from .signals import family_data_changed, stock_levels_changed
+from .substitutions import get_closures
+from .units import convert
+
+QUANTITY_FIELD = PantryStock._meta.get_field("qty_available")
+QUANTITY_STEP = Decimal(1).scaleb(-QUANTITY_FIELD.decimal_places)
+
+
+def _amount_case(amounts):
+    """Return a CASE expression mapping PantryStock ids to amounts"""
+    output_field = DecimalField(max_digits=QUANTITY_FIELD.max_digits, decimal_places=QUANTITY_FIELD.decimal_places)
+    return Case(
+        *[When(pk=stock_id, then=Value(amount, output_field=output_field)) for stock_id, amount in amounts.items()],
+        default=Value(Decimal(0), output_field=output_field),
+        output_field=output_field,
+    )
+
+
+def _adjust(field, deltas, **extra):
+    """Add signed {stock_id: delta} amounts to a PantryStock column in one UPDATE, clamped at zero"""
+    PantryStock.objects.filter(pk__in=deltas).update(
+        **{field: Greatest(F(field) + _amount_case(deltas), Value(Decimal(0)))}, **extra
+    )
+
+
+def _lock_stocks(family_id, ingredient_ids):
+    """
+    Lock a family's pantry rows for the given ingredients.
+
+    Returns {ingredient_id: (stock_id, unit, density)} and the free quantity,
+    not held by open orders, of each row as {ingredient_id: quantity}.
+    """
+    stocks = {}
+    free = {}
+    for stock_id, ingredient_id, unit, density, qty_available, qty_reserved in (
+        PantryStock.objects.select_for_update()
+        .filter(family_id=family_id, ingredient_id__in=ingredient_ids)
+        .order_by("pk")
+        .values_list("pk", "ingredient_id", "unit", "ingredient__density", "qty_available", "qty_reserved")
+    ):
+        stocks[ingredient_id] = (stock_id, unit, density)
+        free[ingredient_id] = max(qty_available - qty_reserved, 0)
+    return stocks, free
+
+
+def _used_ingredients(orders):
+    """
+    Return {family_id: [(order_id, ingredient_id, quantity, unit, density, is_substitutable), ...]} for some orders.
+
+    Snapshots do not copy the recipe flags, whether an ingredient may be
+    replaced is read from the order's cuisine.
+    """
+    substitutable = RecipeIngredient.objects.filter(
+        cuisine=OuterRef("order__cuisine"), ingredient=OuterRef("ingredient"), is_substitutable=True
+    )
+    used = defaultdict(list)
+    for family_id, *row in (
+        OrderItemIngredient.objects.filter(order__in=orders)
+        .annotate(is_substitutable=Exists(substitutable))
+        .values_list(
+            "order__family_id", "order_id", "ingredient_id", "quantity", "unit", "ingredient__density", "is_substitutable"
+        )
+    ):
+        used[family_id].append(tuple(row))
+    return used
+
+
+def _substitution_candidates(family_id, rows):
+    """Return the family's substitution closure and every ingredient the rows may be taken from"""
+    ingredient_ids = {row[1] for row in rows}
+    if not any(row[5] for row in rows):
+        # Most recipes have no substitutable ingredient, skip the closure lookup
+        return {}, ingredient_ids
+    closure = get_closures([family_id])[family_id]
+    for row in rows:
+        if row[5]:
+            ingredient_ids.update(substitute_id for substitute_id, _ in closure.get(row[1], ()))
+    return closure, ingredient_ids
+
+
+def _take_from(stocks, free, closure, ingredient_id, quantity, unit, density, is_substitutable):
+    """
+    Pick the pantry row an order ingredient is taken from, the way availability counts it.
+
+    The ingredient's own row is used when its free quantity covers the need,
+    otherwise the nearest substitute in the closure whose free quantity covers
+    it, with the substitution ratio applied. When none does, the own row is
+    used if it is stocked. Returns (ingredient_id, amount in that row's unit),
+    or None if nothing can be taken.
+    """
+    amount = _stock_amount(stocks.get(ingredient_id), quantity, unit, density)
+    if amount is not None and amount <= free[ingredient_id]:
+        return ingredient_id, amount
+    if is_substitutable:
+        for substitute_id, ratio in closure.get(ingredient_id, ()):
+            stock = stocks.get(substitute_id)
+            substitute_amount = _stock_amount(stock, quantity * ratio, unit, stock[2] if stock else None)
+            if substitute_amount is not None and substitute_amount <= free[substitute_id]:
+                return substitute_id, substitute_amount
+    return (ingredient_id, amount) if amount is not None else None
+
+
+def _stock_amount(stock, quantity, unit, density):
+    """Convert a quantity into the unit of a locked pantry row, or None if it cannot be taken from it"""
+    if stock is None:
+        return None
+    amount = convert(quantity, unit, stock[1], density)
+    return amount.quantize(QUANTITY_STEP, ROUND_HALF_UP) if amount is not None else None
+
+
+def _pantry_changed(stock_ids, levels_changed=False):
+    """Refresh availability and data versions, and alerts if quantities changed, after updates that bypass model signals"""
+    ingredients = defaultdict(set)
+    for family_id, ingredient_id in PantryStock.objects.filter(pk__in=stock_ids).values_list("family_id", "ingredient_id"):
+        ingredients[family_id].add(ingredient_id)
+    for family_id, ingredient_ids in ingredients.items():
+        refresh_availability_for_ingredients(family_id, ingredient_ids)
+        family_data_changed(family_id, "pantry", "menu")
+        if levels_changed:
+            stock_levels_changed(family_id, ingredient_ids)
+
+
+def _release(order_ids):
+    """Delete the reservations of some orders and return the released {stock_id: amount}"""
+    released = defaultdict(Decimal)
+    reservation_ids = []
+    for reservation_id, stock_id, quantity in (
+        PantryReservation.objects.select_for_update()
+        .filter(order_id__in=order_ids)
+        .values_list("pk", "pantry_stock_id", "quantity")
+    ):
+        reservation_ids.append(reservation_id)
+        released[stock_id] += quantity
+
+    if reservation_ids:
+        PantryReservation.objects.filter(pk__in=reservation_ids).delete()
+        _adjust("qty_reserved", {stock_id: -amount for stock_id, amount in released.items()})
+    return released
+
+
+def reserve_order_ingredients(orders):
+    """
+    Hold the ingredients of new orders in their family's pantry.
+
+    Substitutable ingredients that are short are held on the substitute the
+    menu counted them against. Ingredients that are not stocked or are
+    stocked in an incompatible unit are not reserved. Reservations may exceed
+    the stock; the menu then shows the affected cuisines as unavailable.
+    """
+    used = _used_ingredients(orders)
+
+    with transaction.atomic():
+        reserved = defaultdict(Decimal)
+        for family_id, rows in used.items():
+            closure, candidates = _substitution_candidates(family_id, rows)
+            stocks, free = _lock_stocks(family_id, candidates)
+            reservations = []
+            for order_id, ingredient_id, quantity, unit, density, is_substitutable in rows:
+                taken = _take_from(stocks, free, closure, ingredient_id, quantity, unit, density, is_substitutable)
+                if taken and taken[1]:
+                    taken_id, amount = taken
+                    stock_id = stocks[taken_id][0]
+                    reservations.append(PantryReservation(order_id=order_id, pantry_stock_id=stock_id, quantity=amount))
+                    reserved[stock_id] += amount
+                    free[taken_id] = max(free[taken_id] - amount, 0)
+            PantryReservation.objects.bulk_create(reservations)
+
+        if reserved:
+            _adjust("qty_reserved", reserved)
+            _pantry_changed(reserved)
+
+
+def release_order_reservations(orders):
+    """Give back the pantry quantities held by orders that will not be cooked"""
+    with transaction.atomic():
+        released = _release([order.pk for order in orders])
+        if released:
+            _pantry_changed(released)
+
+
+def deduct_order_ingredients(order, evaluate_alerts=True):
+    """
+    Deduct the ingredients used by an order from its family's pantry.
+
+    The order is claimed with a conditional update first, so calling this
+    twice, or from two requests at once, deducts only once. Its reservations
+    are released and the used quantities deducted in the same transaction,
+    from substitutes where the own stock is short, as for reservations.
+    Ingredients that are not stocked or are stocked in an incompatible unit
+    are skipped, and quantities never go below zero. Pass
+    evaluate_alerts=False when the caller runs the alert evaluation itself.
+    Returns True if the order had not been deducted yet.
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        claimed = Order.objects.filter(pk=order.pk, stock_deducted_at__isnull=True).update(stock_deducted_at=now)
+        if not claimed:
+            return False
+        order.stock_deducted_at = now
+
+        released = _release([order.pk])
+
+        used = _used_ingredients([order.pk]).get(order.family_id, [])
+        closure, candidates = _substitution_candidates(order.family_id, used)
+        stocks, free = _lock_stocks(order.family_id, candidates)
+        amounts = defaultdict(Decimal)
+        usage = {}
+        for _, ingredient_id, quantity, unit, density, is_substitutable in used:
+            taken = _take_from(stocks, free, closure, ingredient_id, quantity, unit, density, is_substitutable)
+            if taken is not None:
+                ingredient_id, amount = taken
+                amounts[stocks[ingredient_id][0]] += amount
+                free[ingredient_id] = max(free[ingredient_id] - amount, 0)
+                quantity, unit, density = amount, stocks[ingredient_id][1], stocks[ingredient_id][2]
+            # Usage is recorded for every ingredient, in the pantry unit when it is stocked
+            if ingredient_id in usage:
+                total, total_unit, _ = usage[ingredient_id]
+                quantity = convert(quantity, unit, total_unit, density)
+                if quantity is not None:
+                    usage[ingredient_id] = (total + quantity, total_unit, density)
+            else:
+                usage[ingredient_id] = (quantity, unit, density)
+        if usage:
+            record_usage(order.family_id, usage, now)
+
+        if amounts:
+            _adjust("qty_available", {stock_id: -amount for stock_id, amount in amounts.items()}, updated_at=now)
+        if amounts or released:
+            _pantry_changed(amounts.keys() | released.keys(), levels_changed=bool(amounts) and evaluate_alerts)
+    return True
+
+
+def reserved_total_drift(family_ids=None, stock_ids=None):
+    """
+    Return {stock_id: (qty_reserved, reservation sum)} for pantry rows whose running total is off.
+
+    Optionally limited to some families or pantry rows.
+    """
+    output_field = DecimalField(max_digits=QUANTITY_FIELD.max_digits, decimal_places=QUANTITY_FIELD.decimal_places)
+    reserved = (
+        PantryReservation.objects.filter(pantry_stock=OuterRef("pk"))
+        .order_by()
+        .values("pantry_stock")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    stocks = PantryStock.objects.annotate(
+        expected=Coalesce(Subquery(reserved, output_field=output_field), Value(Decimal(0)), output_field=output_field)
+    ).exclude(qty_reserved=F("expected"))
+    if family_ids:
+        stocks = stocks.filter(family_id__in=family_ids)
+    if stock_ids is not None:
+        stocks = stocks.filter(pk__in=stock_ids)
+    return {
+        stock_id: (stored, expected) for stock_id, stored, expected in stocks.values_list("pk", "qty_reserved", "expected")
+    }
+
+
+def repair_reserved_totals(family_ids=None):
+    """Reset drifted qty_reserved totals to the sum of their reservations and return how many were repaired"""
+    drifted = reserved_total_drift(family_ids)
+    if not drifted:
+        return 0
+
+    with transaction.atomic():
+        # Lock the rows and compare again, so reservations made since the first pass are counted
+        list(PantryStock.objects.select_for_update().filter(pk__in=drifted).order_by("pk").values_list("pk"))
+        drifted = reserved_total_drift(stock_ids=list(drifted))
+        if drifted:
+            PantryStock.objects.filter(pk__in=drifted).update(
+                qty_reserved=_amount_case({stock_id: expected for stock_id, (_, expected) in drifted.items()})
+            )
+            _pantry_changed(drifted)
+    return len(drifted)
+
+
+def compute_prep_list(family_ids):
+    """
+    Return the ingredients needed by the open orders of the given families.
+
+    Required quantities are summed per family, ingredient and unit in one
+    query, converted to the unit the pantry is stocked in and compared with
+    the stock loaded in a second query. Quantities that cannot be converted
+    are listed in their own unit with nothing available. Items are dicts
+    sorted by family and ingredient name.
+    """
+    required = (
+        OrderItemIngredient.objects.filter(order__family_id__in=family_ids, order__status__in=Order.OPEN_STATUSES)
+        .values_list("order__family_id", "ingredient_id", "ingredient__name", "ingredient__density", "unit")
+        .annotate(total=Sum("quantity"))
+        .order_by()
+    )
+    required = list(required)
+    if not required:
+        return []
+
+    stocks = {
+        (family_id, ingredient_id): (qty_available, unit)
+        for family_id, ingredient_id, qty_available, unit in PantryStock.objects.filter(
+            family_id__in={row[0] for row in required}, ingredient_id__in={row[1] for row in required}
+        ).values_list("family_id", "ingredient_id", "qty_available", "unit")
+    }
+
+    items = {}
+    for family_id, ingredient_id, name, density, unit, total in required:
+        qty_available, stock_unit = stocks.get((family_id, ingredient_id), (None, None))
+        converted = convert(total, unit, stock_unit, density) if stock_unit else None
+        if converted is None:
+            # Not stocked, or stocked in a unit the requirement cannot be compared with
+            qty_available, converted, stock_unit = Decimal(0), total, unit
+
+        key = (family_id, ingredient_id, stock_unit)
+        item = items.setdefault(
+            key,
+            {
+                "family_id": family_id,
+                "ingredient_id": ingredient_id,
+                "ingredient_name": name,
+                "unit": stock_unit,
+                "qty_required": Decimal(0),
+                "qty_available": qty_available,
+            },
+        )
+        item["qty_required"] += converted
+
+    for item in items.values():
+        item["qty_required"] = item["qty_required"].quantize(QUANTITY_STEP, ROUND_HALF_UP)
+        item["shortfall"] = max(item["qty_required"] - item["qty_available"], Decimal(0))
+        item["is_short"] = item["shortfall"] > 0
+    return sorted(items.values(), key=lambda item: (item["family_id"], item["ingredient_name"], item["unit"]))
@@ -1,12 +1,16 @@
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
+from .availability import compute_menu_status
 from .models import (
     Alert,
     Cuisine,
+    CuisineAvailability,
     Family,
     FamilyMember,
     Ingredient,
+    IngredientSubstitution,
     LowStockThreshold,
     Order,
     OrderItemIngredient,
@@ -50,10 +54,41 @@ class FamilyMemberSerializer(serializers.ModelSerializer):
 class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ingredient
-        fields = ["id", "name", "description", "created_at"]
+        fields = ["id", "name", "description", "density", "created_at"]
         read_only_fields = ["id", "created_at"]
 
 
+class IngredientSubstitutionSerializer(serializers.ModelSerializer):
+    ingredient = IngredientSerializer(read_only=True)
+    substitute = IngredientSerializer(read_only=True)
+    family = FamilySerializer(read_only=True)
+    ingredient_id = serializers.IntegerField(write_only=True)
+    substitute_id = serializers.IntegerField(write_only=True)
+    family_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
+
+    class Meta:
+        model = IngredientSubstitution
+        fields = [
+            "id",
+            "ingredient",
+            "substitute",
+            "ratio",
+            "family",
+            "created_at",
+            "ingredient_id",
+            "substitute_id",
+            "family_id",
+        ]
+        read_only_fields = ["id", "created_at"]
+
+    def validate(self, attrs):
+        ingredient_id = attrs.get("ingredient_id", getattr(self.instance, "ingredient_id", None))
+        substitute_id = attrs.get("substitute_id", getattr(self.instance, "substitute_id", None))
+        if ingredient_id == substitute_id:
+            raise serializers.ValidationError("An ingredient cannot substitute itself")
+        return attrs
+
+
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     ingredient = IngredientSerializer(read_only=True)
     ingredient_id = serializers.IntegerField(write_only=True)
@@ -98,6 +133,7 @@ class MenuCuisineSerializer(serializers.ModelSerializer):
     recipe_ingredients = RecipeIngredientSerializer(many=True, read_only=True)
     created_by = UserSerializer(read_only=True)
     is_available = serializers.SerializerMethodField()
+    servings_possible = serializers.SerializerMethodField()
 
     class Meta:
         model = Cuisine
@@ -111,11 +147,25 @@ class MenuCuisineSerializer(serializers.ModelSerializer):
             "updated_at",
             "recipe_ingredients",
             "is_available",
+            "servings_possible",
         ]
         read_only_fields = ["id", "created_at", "updated_at", "created_by"]
 
+    def _menu_status(self, obj):
+        # Prefer the batch result computed by MenuViewSet for the whole page
+        statuses = self.context.get("menu_status")
+        if statuses is not None and obj.pk in statuses:
+            return statuses[obj.pk]
+        try:
+            return obj.availability
+        except CuisineAvailability.DoesNotExist:
+            return compute_menu_status([obj])[obj.pk]
+
     def get_is_available(self, obj):
-        return obj.is_available()
+        return self._menu_status(obj).is_available
+
+    def get_servings_possible(self, obj):
+        return self._menu_status(obj).servings_possible
 
 
 class PantryStockSerializer(serializers.ModelSerializer):
@@ -131,6 +181,7 @@ class PantryStockSerializer(serializers.ModelSerializer):
             "family",
             "ingredient",
             "qty_available",
+            "qty_reserved",
             "unit",
             "best_before",
             "created_at",
@@ -138,7 +189,7 @@ class PantryStockSerializer(serializers.ModelSerializer):
             "family_id",
             "ingredient_id",
         ]
-        read_only_fields = ["id", "created_at", "updated_at"]
+        read_only_fields = ["id", "qty_reserved", "created_at", "updated_at"]
 
 
 class OrderItemIngredientSerializer(serializers.ModelSerializer):
@@ -167,19 +218,76 @@ class OrderSerializer(serializers.ModelSerializer):
             "cuisine",
             "created_by",
             "status",
+            "version",
             "scheduled_for",
+            "stock_deducted_at",
             "created_at",
             "updated_at",
             "order_ingredients",
             "family_id",
             "cuisine_id",
         ]
-        read_only_fields = ["id", "created_at", "updated_at", "created_by"]
+        # Status changes go through update_status so they follow the order state machine
+        read_only_fields = ["id", "status", "version", "stock_deducted_at", "created_at", "updated_at", "created_by"]
 
     def create(self, validated_data):
         validated_data["created_by"] = self.context["request"].user
         return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        # Only the edited columns are written, so a status change committed since the order was loaded is kept
+        instance.save(update_fields=[*validated_data, "updated_at"])
+        instance.refresh_from_db(fields=["status", "version", "stock_deducted_at"])
+        return instance
+
+
+class OrderBatchEntrySerializer(serializers.Serializer):
+    cuisine_id = serializers.IntegerField()
+    scheduled_for = serializers.DateTimeField(required=False, allow_null=True)
+
+
+class OrderBatchSerializer(serializers.Serializer):
+    MAX_ORDERS = 50
+
+    family_id = serializers.IntegerField()
+    orders = OrderBatchEntrySerializer(many=True, allow_empty=False, max_length=MAX_ORDERS)
+
+    def validate(self, attrs):
+        family_id = attrs["family_id"]
+        if not FamilyMember.objects.filter(user=self.context["request"].user, family_id=family_id).exists():
+            raise serializers.ValidationError({"family_id": "You are not a member of this family"})
+
+        cuisine_ids = {entry["cuisine_id"] for entry in attrs["orders"]}
+        found = set(Cuisine.objects.filter(family_id=family_id, pk__in=cuisine_ids).values_list("pk", flat=True))
+        if cuisine_ids - found:
+            unknown = ", ".join(str(cuisine_id) for cuisine_id in sorted(cuisine_ids - found))
+            raise serializers.ValidationError({"orders": f"Unknown cuisines for this family: {unknown}"})
+        return attrs
+
+
+class PrepListItemSerializer(serializers.Serializer):
+    family_id = serializers.IntegerField()
+    ingredient_id = serializers.IntegerField()
+    ingredient_name = serializers.CharField()
+    unit = serializers.CharField()
+    qty_required = serializers.DecimalField(max_digits=12, decimal_places=2)
+    qty_available = serializers.DecimalField(max_digits=12, decimal_places=2)
+    shortfall = serializers.DecimalField(max_digits=12, decimal_places=2)
+    is_short = serializers.BooleanField()
+
+
+class PantryForecastItemSerializer(serializers.Serializer):
+    family_id = serializers.IntegerField()
+    ingredient_id = serializers.IntegerField()
+    ingredient_name = serializers.CharField()
+    unit = serializers.CharField()
+    qty_available = serializers.DecimalField(max_digits=12, decimal_places=2)
+    daily_rate = serializers.DecimalField(max_digits=14, decimal_places=4, allow_null=True)
+    days_left = serializers.DecimalField(max_digits=12, decimal_places=1, allow_null=True)
+    stock_out_date = serializers.DateField(allow_null=True)
+
 
 class AlertSerializer(serializers.ModelSerializer):
     ingredient = IngredientSerializer(read_only=True)
@@ -199,6 +307,29 @@ class AlertSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id", "created_at", "resolved_at"]
 
+    OPEN_ALERT_EXISTS = "An open alert of this type already exists for this ingredient"
+
+    def validate(self, attrs):
+        # A family has at most one open alert of each type per ingredient
+        if self.instance is not None and not attrs.get("is_resolved", self.instance.is_resolved):
+            duplicate = Alert.objects.filter(
+                family_id=self.instance.family_id,
+                ingredient_id=self.instance.ingredient_id,
+                alert_type=attrs.get("alert_type", self.instance.alert_type),
+                is_resolved=False,
+            ).exclude(pk=self.instance.pk)
+            if duplicate.exists():
+                raise serializers.ValidationError(self.OPEN_ALERT_EXISTS)
+        return attrs
+
+    def update(self, instance, validated_data):
+        # The check above can race a concurrent write, the constraint has the last word
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(self.OPEN_ALERT_EXISTS)
+
 
 class LowStockThresholdSerializer(serializers.ModelSerializer):
     ingredient = IngredientSerializer(read_only=True)
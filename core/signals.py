@@ -0,0 +1,215 @@
+"""
+Signal handlers that keep derived data in sync with the models it is computed from
+"""
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import menu_cache
+from .alerting import resolve_replenished
+from .availability import (
+    refresh_availability,
+    refresh_availability_for_all_families,
+    refresh_availability_for_ingredients,
+)
+from .models import (
+    Cuisine,
+    Family,
+    Ingredient,
+    IngredientSubstitution,
+    LowStockThreshold,
+    Order,
+    PantryStock,
+    RecipeIngredient,
+)
+from .substitutions import ingredients_affected_by, invalidate_closures
+from .versioning import bump_all_versions, bump_versions
+
+
+def family_data_changed(family_id, *resources):
+    """
+    Record that some of a family's resources changed.
+
+    Called by the handlers below and by bulk writes that bypass model signals.
+    """
+    bump_versions(family_id, *resources)
+    if "menu" in resources:
+        # After commit, so a concurrent read cannot cache pre-write data under the new generation
+        transaction.on_commit(lambda: menu_cache.invalidate_family(family_id))
+
+
+def shared_data_changed(*resources):
+    """Record that data shared by every family changed"""
+    bump_all_versions(*resources)
+    if "menu" in resources:
+        transaction.on_commit(menu_cache.invalidate_all)
+
+
+def stock_levels_changed(family_id, ingredient_ids):
+    """
+    Re-check the alerts of some of a family's ingredients once the current transaction commits.
+
+    Called by the handlers below and by bulk pantry updates that bypass model signals.
+    """
+    from .tasks import evaluate_pantry_alerts
+
+    ingredient_ids = sorted(ingredient_ids)
+    transaction.on_commit(lambda: evaluate_pantry_alerts.delay(family_id, ingredient_ids), robust=True)
+
+
+def _deleted_with(origin, *models):
+    """Check whether a delete cascades from one of the given parent models"""
+    if isinstance(origin, QuerySet):
+        return issubclass(origin.model, models)
+    return isinstance(origin, models)
+
+
+@receiver(post_save, sender=Family)
+def family_created(sender, instance, created, **kwargs):
+    # Family ids can be reused after a delete, never serve cached data of the previous owner
+    if created:
+        invalidate_closures(instance.pk)
+        menu_cache.invalidate_family(instance.pk)
+
+
+def _remember_stored(instance, fields, update_fields, *lookups):
+    """
+    Keep the stored values of some foreign keys on an instance being saved, so post_save can refresh them too.
+
+    fields are the foreign key names; lookups are extra values read along with them.
+    """
+    instance._stored = None
+    if instance._state.adding:
+        return
+    if update_fields is not None and not {instance._meta.get_field(name).name for name in update_fields} & set(fields):
+        return
+    values = [f"{name}_id" for name in fields] + list(lookups)
+    instance._stored = type(instance).objects.filter(pk=instance.pk).values(*values).first()
+
+
+def _pop_stored(instance):
+    return vars(instance).pop("_stored", None)
+
+
+@receiver(pre_save, sender=PantryStock)
+def pantry_stock_saving(sender, instance, update_fields=None, **kwargs):
+    _remember_stored(instance, ("family", "ingredient"), update_fields)
+
+
+@receiver(post_save, sender=PantryStock)
+@receiver(post_delete, sender=PantryStock)
+def pantry_stock_changed(sender, instance, origin=None, **kwargs):
+    stored = _pop_stored(instance)
+    # Availability rows are removed together with the family, nothing to refresh
+    if _deleted_with(origin, Family):
+        return
+    # A row moved to another ingredient or family leaves the old one without its stock
+    keys = {(instance.family_id, instance.ingredient_id)}
+    if stored is not None:
+        keys.add((stored["family_id"], stored["ingredient_id"]))
+    for family_id, ingredient_id in sorted(keys):
+        refresh_availability_for_ingredients(family_id, [ingredient_id])
+        family_data_changed(family_id, "pantry", "menu")
+        resolve_replenished(family_id, [ingredient_id])
+        stock_levels_changed(family_id, [ingredient_id])
+
+
+@receiver(post_save, sender=LowStockThreshold)
+@receiver(post_delete, sender=LowStockThreshold)
+def low_stock_threshold_changed(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, Family):
+        return
+    resolve_replenished(instance.family_id, [instance.ingredient_id])
+    stock_levels_changed(instance.family_id, [instance.ingredient_id])
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_saving(sender, instance, update_fields=None, **kwargs):
+    _remember_stored(instance, ("cuisine",), update_fields, "cuisine__family_id")
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, origin=None, **kwargs):
+    stored = _pop_stored(instance)
+    # Refreshing a cuisine that is being deleted would resurrect its availability row
+    if _deleted_with(origin, Family, Cuisine):
+        return
+    cuisine_ids = {instance.cuisine_id}
+    family_ids = {instance.cuisine.family_id}
+    # An ingredient moved to another cuisine leaves the old one without it
+    if stored is not None:
+        cuisine_ids.add(stored["cuisine_id"])
+        family_ids.add(stored["cuisine__family_id"])
+    refresh_availability(sorted(cuisine_ids))
+    # Orders embed their cuisine's recipe
+    for family_id in family_ids:
+        family_data_changed(family_id, "menu", "orders")
+
+
+@receiver(post_save, sender=Cuisine)
+def cuisine_changed(sender, instance, **kwargs):
+    refresh_availability([instance.pk])
+    family_data_changed(instance.family_id, "menu", "orders")
+
+
+@receiver(post_delete, sender=Cuisine)
+def cuisine_deleted(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, Family):
+        return
+    family_data_changed(instance.family_id, "menu", "orders")
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, Family):
+        return
+    family_data_changed(instance.family_id, "orders")
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleted(sender, instance, origin=None, **kwargs):
+    # Reservations are deleted together with the order, give their quantities back first
+    if _deleted_with(origin, Family):
+        return
+    from .pantry import release_order_reservations
+
+    release_order_reservations([instance])
+
+
+@receiver(pre_save, sender=Ingredient)
+def ingredient_saving(sender, instance, update_fields=None, **kwargs):
+    # The density converts recipe volumes into pantry masses, a change moves stored availability
+    instance._density_changed = (
+        not instance._state.adding
+        and (update_fields is None or "density" in update_fields)
+        and Ingredient.objects.filter(pk=instance.pk).values_list("density", flat=True).first() != instance.density
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    # Ingredients are shared by every family and nested in all versioned resources
+    if not created:
+        if instance._density_changed:
+            refresh_availability_for_all_families([instance.pk])
+        shared_data_changed("menu", "orders", "pantry")
+
+
+@receiver(post_save, sender=IngredientSubstitution)
+@receiver(post_delete, sender=IngredientSubstitution)
+def substitution_changed(sender, instance, origin=None, **kwargs):
+    invalidate_closures(instance.family_id)
+    if _deleted_with(origin, Family):
+        return
+
+    affected = ingredients_affected_by(instance)
+    if instance.family_id is None:
+        refresh_availability_for_all_families(affected)
+        shared_data_changed("menu")
+    else:
+        refresh_availability_for_ingredients(instance.family_id, affected)
+        family_data_changed(instance.family_id, "menu")
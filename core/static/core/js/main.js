@@ -64,21 +64,21 @@ class FamilyChef {
         }
     }
 
-    async loadInitialData() {
+    async loadInitialData(options = {}) {
         try {
             // Load menu data
-            const menuData = await this.fetchAPI('/menu/');
+            const menuData = await this.fetchAPI('/menu/', options);
             this.renderMenu(menuData);
 
             // Load orders if on chef board
             if (document.querySelector('.chef-board')) {
-                const ordersData = await this.fetchAPI('/orders/');
+                const ordersData = await this.fetchAPI('/orders/', options);
                 this.renderOrders(ordersData);
             }
 
             // Load pantry data if on pantry page
             if (document.querySelector('.pantry-view')) {
-                const pantryData = await this.fetchAPI('/pantry-stock/');
+                const pantryData = await this.fetchAPI('/pantry-stock/', options);
                 this.renderPantry(pantryData);
             }
 
@@ -90,25 +90,32 @@ class FamilyChef {
 
     async fetchAPI(endpoint, options = {}) {
         const url = `${this.apiBase}${endpoint}`;
-        
+        const { revalidate, ...fetchOptions } = options;
+        const isGet = fetchOptions.method === 'GET' || !fetchOptions.method;
+        const cached = isGet ? this.cache.get(url) : null;
+
         // Check cache first
-        if (options.method === 'GET' || !options.method) {
-            const cached = this.cache.get(url);
-            if (cached && Date.now() - cached.timestamp < 300000) { // 5 min cache
-                return cached.data;
-            }
+        if (cached && !revalidate && Date.now() - cached.timestamp < 300000) { // 5 min cache
+            return cached.data;
         }
 
         try {
             const response = await fetch(url, {
+                ...fetchOptions,
                 headers: {
                     'Content-Type': 'application/json',
                     'X-Requested-With': 'XMLHttpRequest',
-                    ...options.headers
-                },
-                ...options
+                    // Let the server answer 304 when nothing changed since the cached copy
+                    ...(cached && cached.etag ? { 'If-None-Match': cached.etag } : {}),
+                    ...fetchOptions.headers
+                }
             });
 
+            if (response.status === 304 && cached) {
+                cached.timestamp = Date.now();
+                return cached.data;
+            }
+
             if (!response.ok) {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
@@ -116,9 +123,10 @@ class FamilyChef {
             const data = await response.json();
             
             // Cache GET requests
-            if (options.method === 'GET' || !options.method) {
+            if (isGet) {
                 this.cache.set(url, {
                     data,
+                    etag: response.headers.get('ETag'),
                     timestamp: Date.now()
                 });
             }
@@ -171,7 +179,8 @@ class FamilyChef {
 
         const orders = data.results || data;
         const ordersByStatus = {
-            'NEW': orders.filter(o => o.status === 'NEW'),
+            // Scheduled orders whose cooking time has come wait in the NEW column
+            'NEW': orders.filter(o => o.status === 'NEW' || o.status === 'READY'),
             'COOKING': orders.filter(o => o.status === 'COOKING'),
             'DONE': orders.filter(o => o.status === 'DONE')
         };
@@ -196,10 +205,13 @@ class FamilyChef {
 
     getOrderActions(order) {
         switch (order.status) {
+            case 'READY':
+                return `<span class="status-badge ready">Start now</span>
+                    <button class="btn btn-warning" data-action="update-status" data-order-id="${order.id}" data-version="${order.version}" data-status="COOKING">Start Cooking</button>`;
             case 'NEW':
-                return `<button class="btn btn-warning" data-action="update-status" data-order-id="${order.id}" data-status="COOKING">Start Cooking</button>`;
+                return `<button class="btn btn-warning" data-action="update-status" data-order-id="${order.id}" data-version="${order.version}" data-status="COOKING">Start Cooking</button>`;
             case 'COOKING':
-                return `<button class="btn btn-success" data-action="update-status" data-order-id="${order.id}" data-status="DONE">Mark Done</button>`;
+                return `<button class="btn btn-success" data-action="update-status" data-order-id="${order.id}" data-version="${order.version}" data-status="DONE">Mark Done</button>`;
             case 'DONE':
                 return `<span class="status-badge done">Completed</span>`;
             default:
@@ -227,15 +239,17 @@ class FamilyChef {
     async handleStatusUpdate(button) {
         const orderId = button.dataset.orderId;
         const newStatus = button.dataset.status;
+        // Sending the version we rendered makes the server reject changes made meanwhile on another device
+        const version = Number(button.dataset.version);
 
         try {
             await this.fetchAPI(`/orders/${orderId}/update_status/`, {
                 method: 'PATCH',
-                body: JSON.stringify({ status: newStatus })
+                body: JSON.stringify({ status: newStatus, version })
             });
 
-            // Refresh orders display
-            const ordersData = await this.fetchAPI('/orders/');
+            // Refresh orders display, the cached list still shows the old status
+            const ordersData = await this.fetchAPI('/orders/', { revalidate: true });
             this.renderOrders(ordersData);
 
             this.showNotification('Order status updated!', 'success');
@@ -307,9 +321,8 @@ class FamilyChef {
             refreshInterval = setInterval(async () => {
                 if (!document.hidden) {
                     try {
-                        // Clear cache to force fresh data
-                        this.cache.clear();
-                        await this.loadInitialData();
+                        // Revalidate cached data; unchanged resources come back as 304
+                        await this.loadInitialData({ revalidate: true });
                     } catch (error) {
                         console.error('Failed to refresh data:', error);
                     }
@@ -0,0 +1,146 @@
+"""
+Ingredient substitution graph
+
+Each family sees the global substitutions plus its own. The transitive
+closure of that graph is computed once and kept in the cache, so availability
+checks only do dictionary lookups. Changing a substitution row invalidates the
+closures it can affect.
+"""
+
+from collections import defaultdict, deque
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import IngredientSubstitution
+
+CLOSURE_CACHE_TIMEOUT = 60 * 60 * 24
+GLOBAL_VERSION_KEY = "substitutions:global_version"
+
+
+def _closure_key(family_id, global_version):
+    return f"substitutions:closure:{global_version}:{family_id}"
+
+
+def _global_version():
+    version = cache.get(GLOBAL_VERSION_KEY)
+    if version is None:
+        cache.add(GLOBAL_VERSION_KEY, 0, timeout=None)
+        version = cache.get(GLOBAL_VERSION_KEY, 0)
+    return version
+
+
+def build_closure(edges):
+    """
+    Return {ingredient_id: ((substitute_id, ratio), ...)} for a list of edges.
+
+    Edges are (ingredient_id, substitute_id, ratio) tuples. Chained
+    substitutions multiply their ratios; when a substitute is reachable in
+    several ways the shortest chain wins.
+    """
+    graph = defaultdict(list)
+    for ingredient_id, substitute_id, ratio in edges:
+        graph[ingredient_id].append((substitute_id, ratio))
+
+    closure = {}
+    for ingredient_id in graph:
+        reached = {}
+        queue = deque([(ingredient_id, 1)])
+        while queue:
+            current, current_ratio = queue.popleft()
+            for substitute_id, ratio in graph.get(current, ()):
+                if substitute_id == ingredient_id or substitute_id in reached:
+                    continue
+                reached[substitute_id] = current_ratio * ratio
+                queue.append((substitute_id, reached[substitute_id]))
+        closure[ingredient_id] = tuple(reached.items())
+    return closure
+
+
+def get_closures(family_ids):
+    """Return {family_id: closure} for the given families, computing missing ones in one query"""
+    family_ids = set(family_ids)
+    if not family_ids:
+        return {}
+
+    global_version = _global_version()
+    keys = {_closure_key(family_id, global_version): family_id for family_id in family_ids}
+    closures = {keys[key]: closure for key, closure in cache.get_many(keys).items()}
+
+    missing = family_ids - closures.keys()
+    if missing:
+        edges = defaultdict(list)
+        global_edges = []
+        for family_id, ingredient_id, substitute_id, ratio in IngredientSubstitution.objects.filter(
+            Q(family__isnull=True) | Q(family_id__in=missing)
+        ).values_list("family_id", "ingredient_id", "substitute_id", "ratio"):
+            (global_edges if family_id is None else edges[family_id]).append((ingredient_id, substitute_id, ratio))
+
+        computed = {family_id: build_closure(global_edges + edges[family_id]) for family_id in missing}
+        cache.set_many(
+            {_closure_key(family_id, global_version): closure for family_id, closure in computed.items()},
+            timeout=CLOSURE_CACHE_TIMEOUT,
+        )
+        closures.update(computed)
+
+    return closures
+
+
+def _drop_closures(family_id):
+    if family_id is not None:
+        cache.delete(_closure_key(family_id, _global_version()))
+        return
+
+    cache.add(GLOBAL_VERSION_KEY, 0, timeout=None)
+    try:
+        cache.incr(GLOBAL_VERSION_KEY)
+    except ValueError:
+        # The key was evicted between add() and incr()
+        cache.set(GLOBAL_VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_closures(family_id=None):
+    """
+    Drop the cached closure of one family, or of every family for global substitutions.
+
+    The closure is dropped right away, so the writing transaction sees its own
+    rows, and again once it commits, discarding anything a concurrent reader
+    cached from the rows as they were before the commit.
+    """
+    _drop_closures(family_id)
+    transaction.on_commit(lambda: _drop_closures(family_id))
+
+
+def ingredients_replaceable_by(closure, substitute_ids):
+    """Return the ingredients that can be replaced by any of the given substitutes"""
+    substitute_ids = set(substitute_ids)
+    return {
+        ingredient_id
+        for ingredient_id, substitutes in closure.items()
+        if any(substitute_id in substitute_ids for substitute_id, _ in substitutes)
+    }
+
+
+def ingredients_affected_by(substitution):
+    """
+    Return the ingredients whose closure can change when a substitution row changes.
+
+    These are the replaced ingredient and every ingredient that can reach it
+    through other substitutions visible to the same families.
+    """
+    rows = IngredientSubstitution.objects.all()
+    if substitution.family_id is not None:
+        rows = rows.filter(Q(family__isnull=True) | Q(family_id=substitution.family_id))
+
+    replaced_by = defaultdict(set)
+    for ingredient_id, substitute_id in rows.values_list("ingredient_id", "substitute_id"):
+        replaced_by[substitute_id].add(ingredient_id)
+
+    affected = {substitution.ingredient_id}
+    queue = deque(affected)
+    while queue:
+        for ingredient_id in replaced_by[queue.popleft()] - affected:
+            affected.add(ingredient_id)
+            queue.append(ingredient_id)
+    return affected
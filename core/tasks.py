@@ -2,12 +2,91 @@
 Celery tasks for background processing
 """
 
+import time
+from collections import Counter
 from datetime import date, timedelta
-from decimal import Decimal
-
-from celery import shared_task
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from celery import chain, chord, group, shared_task
+from django.db import DatabaseError, transaction
+from django.db.models import Case, Exists, F, FilteredRelation, Max, Min, OuterRef, Q, Value, When
+from django.utils import timezone
+
+from .alerting import EXPIRY_WARNING_DAYS
+from .forecast import daily_rate, forecast_quantity
+from .models import Alert, Family, Order, PantryStock, ShoppingList
+from .serializers import OrderSerializer
+from .signals import family_data_changed
+from .substitutions import get_closures
+from .units import convert
+from .utils import send_order_update, send_start_cooking
+
+# Family ids per shard of the daily alert and shopping list run
+FAMILY_SHARD_SIZE = 1000
+# Rows read and written per round trip when generating shopping lists
+SHOPPING_BATCH_SIZE = 2000
+# Upper bound on the orders handled by one run of the dispatch sweeper
+DISPATCH_BATCH_SIZE = 500
+
+
+def _create_low_stock_alerts(pantry_items):
+    """
+    Create missing LOW_STOCK alerts for pantry items at or below their threshold.
 
-from .models import Alert, Family, LowStockThreshold, PantryStock, ShoppingList
+    Pantry rows are joined with their family's threshold in one query, leaving
+    out rows that already have an open alert and rows stocked in the threshold's
+    unit that are above it. Thresholds in other units are converted to the pantry
+    unit in memory, skipping incompatible ones, and the new alerts are written
+    with one bulk insert. Returns the number of rows scanned and alerts created.
+    """
+    open_alerts = Alert.objects.filter(
+        family=OuterRef("family"), ingredient=OuterRef("ingredient"), alert_type="LOW_STOCK", is_resolved=False
+    )
+    rows = (
+        pantry_items.annotate(
+            threshold=FilteredRelation(
+                "ingredient__lowstockthreshold", condition=Q(ingredient__lowstockthreshold__family=F("family"))
+            )
+        )
+        .filter(
+            ~Q(unit=F("threshold__unit")) | Q(qty_available__lte=F("threshold__threshold_qty")),
+            threshold__isnull=False,
+        )
+        .exclude(Exists(open_alerts))
+        .values_list(
+            "family_id",
+            "ingredient_id",
+            "ingredient__name",
+            "ingredient__density",
+            "qty_available",
+            "unit",
+            "threshold__threshold_qty",
+            "threshold__unit",
+        )
+    )
+
+    alerts = []
+    scanned = 0
+    for family_id, ingredient_id, name, density, qty_available, unit, threshold_qty, threshold_unit in rows:
+        scanned += 1
+        # Compare in the pantry unit; thresholds in incompatible units are skipped
+        converted = convert(threshold_qty, threshold_unit, unit, density)
+        if converted is not None and qty_available <= converted:
+            alerts.append(
+                Alert(
+                    family_id=family_id,
+                    ingredient_id=ingredient_id,
+                    alert_type="LOW_STOCK",
+                    message=f"Low stock: {name} has {qty_available} {unit} remaining "
+                    f"(threshold: {threshold_qty} {threshold_unit})",
+                )
+            )
+
+    # Alerts created concurrently since the scan are skipped by the open-alert constraint
+    Alert.objects.bulk_create(alerts, ignore_conflicts=True)
+    return scanned, len(alerts)
 
 
 @shared_task
@@ -15,45 +94,56 @@ def check_low_stock_alerts():
     """
     Check for low stock conditions and create alerts
     """
-    alerts_created = 0
+    started = time.monotonic()
+    scanned, alerts_created = _create_low_stock_alerts(PantryStock.objects.all())
 
-    # Get all families
-    families = Family.objects.all()
+    return f"Created {alerts_created} low stock alerts (scanned {scanned} rows in {time.monotonic() - started:.2f}s)"
 
-    for family in families:
-        # Get pantry stock for this family
-        pantry_items = PantryStock.objects.filter(family=family)
 
-        for pantry_item in pantry_items:
-            # Check if there's a threshold configured for this ingredient
-            try:
-                threshold = LowStockThreshold.objects.get(family=family, ingredient=pantry_item.ingredient)
-
-                # Simple unit comparison - assumes same units for now
-                # TODO: Add unit conversion logic
-                if pantry_item.unit == threshold.unit and pantry_item.qty_available <= threshold.threshold_qty:
-
-                    # Check if there's already an active alert for this
-                    existing_alert = Alert.objects.filter(
-                        family=family, ingredient=pantry_item.ingredient, alert_type="LOW_STOCK", is_resolved=False
-                    ).exists()
+def _create_expiry_alerts(pantry_items):
+    """
+    Create missing EXPIRED and EXPIRING_SOON alerts for the given pantry items.
 
-                    if not existing_alert:
-                        Alert.objects.create(
-                            family=family,
-                            ingredient=pantry_item.ingredient,
-                            alert_type="LOW_STOCK",
-                            message=f"Low stock: {pantry_item.ingredient.name} has "
-                            f"{pantry_item.qty_available} {pantry_item.unit} remaining "
-                            f"(threshold: {threshold.threshold_qty} {threshold.unit})",
-                        )
-                        alerts_created += 1
+    Items without an open alert of the same type are read in one query from
+    the best_before index and the new alerts written with one bulk insert.
+    Returns the number of alerts created.
+    """
+    today = date.today()
+    alert_type = Case(When(best_before__lte=today, then=Value("EXPIRED")), default=Value("EXPIRING_SOON"))
+    open_alerts = Alert.objects.filter(
+        family=OuterRef("family"), ingredient=OuterRef("ingredient"), alert_type=OuterRef("alert_type"), is_resolved=False
+    )
+
+    # Items expired or expiring soon without an open alert of the same type, from the best_before index
+    items = (
+        pantry_items.filter(best_before__isnull=False, best_before__lte=today + timedelta(days=EXPIRY_WARNING_DAYS))
+        .annotate(alert_type=alert_type)
+        .exclude(Exists(open_alerts))
+        .values_list("family_id", "ingredient_id", "ingredient__name", "best_before", "alert_type")
+    )
+
+    alerts = []
+    for family_id, ingredient_id, name, best_before, item_alert_type in items:
+        if item_alert_type == "EXPIRED":
+            message = f"Expired: {name} expired on {best_before}"
+        else:
+            message = f"Expiring soon: {name} expires in {(best_before - today).days} day(s) on {best_before}"
+        alerts.append(Alert(family_id=family_id, ingredient_id=ingredient_id, alert_type=item_alert_type, message=message))
+    # Alerts created concurrently since the scan are skipped by the open-alert constraint
+    Alert.objects.bulk_create(alerts, ignore_conflicts=True)
 
-            except LowStockThreshold.DoesNotExist:
-                # No threshold configured for this ingredient, skip
-                continue
+    # Warnings for items that have expired since are replaced by the EXPIRED alert, only the scanned rows are touched
+    expired = pantry_items.filter(best_before__lte=today)
+    Alert.objects.filter(
+        alert_type="EXPIRING_SOON",
+        is_resolved=False,
+        family_id__in=expired.values("family_id"),
+        ingredient_id__in=expired.values("ingredient_id"),
+    ).filter(Exists(expired.filter(family=OuterRef("family"), ingredient=OuterRef("ingredient")))).update(
+        is_resolved=True, resolved_at=timezone.now()
+    )
 
-    return f"Created {alerts_created} low stock alerts"
+    return len(alerts)
 
 
 @shared_task
@@ -61,33 +151,72 @@ def check_expired_items():
     """
     Check for expired items and create alerts
     """
-    alerts_created = 0
-    today = date.today()
+    alerts_created = _create_expiry_alerts(PantryStock.objects.all())
 
-    # Find all pantry items that are expired or expiring soon (within 3 days)
-    expiring_items = PantryStock.objects.filter(best_before__isnull=False, best_before__lte=today + timedelta(days=3))
+    return f"Created {alerts_created} expiry alerts"
 
-    for item in expiring_items:
-        # Determine alert type based on expiry date
-        if item.best_before <= today:
-            alert_type = "EXPIRED"
-            message = f"Expired: {item.ingredient.name} expired on {item.best_before}"
-        else:
-            # For items expiring soon, we'll still use EXPIRED type but with different message
-            days_until_expiry = (item.best_before - today).days
-            alert_type = "EXPIRED"
-            message = f"Expiring soon: {item.ingredient.name} expires in " f"{days_until_expiry} day(s) on {item.best_before}"
 
-        # Check if there's already an active alert for this item
-        existing_alert = Alert.objects.filter(
-            family=item.family, ingredient=item.ingredient, alert_type="EXPIRED", is_resolved=False
-        ).exists()
+@shared_task
+def evaluate_pantry_alerts(family_id, ingredient_ids):
+    """
+    Create the alerts of some of a family's ingredients after their stock or threshold changed
+    """
+    pantry_items = PantryStock.objects.filter(family_id=family_id, ingredient_id__in=ingredient_ids)
+    _, low_stock_alerts = _create_low_stock_alerts(pantry_items)
+    expiry_alerts = _create_expiry_alerts(pantry_items)
 
-        if not existing_alert:
-            Alert.objects.create(family=item.family, ingredient=item.ingredient, alert_type=alert_type, message=message)
-            alerts_created += 1
+    return f"Created {low_stock_alerts + expiry_alerts} alerts"
 
-    return f"Created {alerts_created} expiry alerts"
+
+def _family_shards():
+    """Split the range of family ids into [start, end) shards of FAMILY_SHARD_SIZE ids"""
+    bounds = Family.objects.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return []
+    return [(start, start + FAMILY_SHARD_SIZE) for start in range(bounds["first"], bounds["last"] + 1, FAMILY_SHARD_SIZE)]
+
+
+@shared_task(autoretry_for=(DatabaseError,), retry_backoff=True, max_retries=3)
+def process_family_shard(start, end, generate_shopping=False):
+    """
+    Run the daily alert checks, and optionally shopping list generation, for families with ids in [start, end)
+
+    Every step skips work that is already done, so a failed shard is simply
+    retried on its own.
+    """
+    in_shard = {"family_id__gte": start, "family_id__lt": end}
+    _, low_stock_alerts = _create_low_stock_alerts(PantryStock.objects.filter(**in_shard))
+    expiry_alerts = _create_expiry_alerts(PantryStock.objects.filter(**in_shard))
+    shopping_items = _upsert_shopping_items(Alert.objects.filter(is_resolved=False, **in_shard)) if generate_shopping else 0
+
+    return {"low_stock_alerts": low_stock_alerts, "expiry_alerts": expiry_alerts, "shopping_items": shopping_items}
+
+
+@shared_task
+def summarize_family_shards(results, generate_shopping=False):
+    """
+    Add up the counts of every family shard once all of them finished
+    """
+    totals = Counter()
+    for result in results:
+        totals.update(result)
+
+    summary = (
+        f"Daily alert check completed. Created {totals['low_stock_alerts']} low stock alerts. "
+        f"Created {totals['expiry_alerts']} expiry alerts."
+    )
+    if generate_shopping:
+        summary = f"Daily tasks completed. {summary} Generated {totals['shopping_items']} shopping list items"
+    return summary
+
+
+def _fan_out(generate_shopping):
+    """Run process_family_shard for every shard in parallel, followed by the summary"""
+    shards = _family_shards()
+    header = group(process_family_shard.si(start, end, generate_shopping) for start, end in shards)
+    chord(header, summarize_family_shards.s(generate_shopping=generate_shopping)).apply_async()
+
+    return f"Dispatched {len(shards)} family shards"
 
 
 @shared_task
@@ -95,10 +224,121 @@ def daily_alert_check():
     """
     Combined daily task to check both low stock and expired items
     """
-    low_stock_result = check_low_stock_alerts()
-    expiry_result = check_expired_items()
+    return _fan_out(generate_shopping=False)
+
+
+def _shopping_needs(active_alerts):
+    """
+    Yield (family_id, ingredient_id, qty_needed, unit, computed) for the ingredients of active alerts.
+
+    Alerts are joined with the family's threshold, pantry row and consumption
+    rate in one streamed query. With a consumption rate, low stock is topped up to the
+    threshold plus the forecast usage over SHOPPING_FORECAST_DAYS and expired
+    items are replaced with that usage. Without one, low stock is topped up to
+    1.5 times the threshold and expired items are replaced with the amount in
+    the pantry. Low stock needs are in the threshold's unit.
+    When both apply to an ingredient the first need that can be computed
+    wins, low stock first. Needs that cannot be computed default to 1 unit
+    and have computed set to False.
+    """
+    rows = (
+        active_alerts.annotate(
+            threshold=FilteredRelation(
+                "ingredient__lowstockthreshold", condition=Q(ingredient__lowstockthreshold__family=F("family"))
+            ),
+            stock=FilteredRelation("ingredient__pantrystock", condition=Q(ingredient__pantrystock__family=F("family"))),
+            consumption=FilteredRelation(
+                "ingredient__consumptionrate", condition=Q(ingredient__consumptionrate__family=F("family"))
+            ),
+        )
+        # Descending alert type puts LOW_STOCK before EXPIRING_SOON and EXPIRED for each ingredient
+        .order_by("family_id", "ingredient_id", "-alert_type").values_list(
+            "family_id",
+            "ingredient_id",
+            "alert_type",
+            "ingredient__density",
+            "threshold__threshold_qty",
+            "threshold__unit",
+            "stock__qty_available",
+            "stock__unit",
+            "consumption__decayed_usage",
+            "consumption__unit",
+            "consumption__updated_at",
+        )
+    )
+    now = timezone.now()
+
+    grouped = groupby(rows.iterator(chunk_size=SHOPPING_BATCH_SIZE), key=itemgetter(0, 1))
+    for (family_id, ingredient_id), ingredient_rows in grouped:
+        for (
+            _,
+            _,
+            alert_type,
+            density,
+            threshold_qty,
+            threshold_unit,
+            qty_available,
+            stock_unit,
+            *consumption,
+        ) in ingredient_rows:
+            decayed_usage, rate_unit, rate_updated_at = consumption
+            rate = daily_rate(decayed_usage, rate_updated_at, now) if decayed_usage is not None else None
+
+            if alert_type == "LOW_STOCK" and threshold_qty is not None and qty_available is not None:
+                # Stock in an incompatible unit does not count
+                current = convert(qty_available, stock_unit, threshold_unit, density) or Decimal(0)
+                forecast = forecast_quantity(rate, rate_unit, threshold_unit, density)
+                if forecast is not None:
+                    # Stay above the threshold for the forecast horizon
+                    target = threshold_qty + forecast
+                else:
+                    # Buy enough to reach threshold + 50% buffer
+                    target = threshold_qty * Decimal("1.5")
+                yield family_id, ingredient_id, target - current, threshold_unit, True
+                break
+            if alert_type != "LOW_STOCK" and qty_available is not None:
+                # For expired items, replace what the forecast horizon needs, or else the expired amount
+                forecast = forecast_quantity(rate, rate_unit, stock_unit, density)
+                yield family_id, ingredient_id, forecast if forecast is not None else qty_available, stock_unit, True
+                break
+        else:
+            # Default to buying 1 unit if we can't determine specifics
+            yield family_id, ingredient_id, Decimal("1.0"), "unit", False
+
+
+def _upsert_shopping_items(active_alerts):
+    """
+    Write shopping list items for active alerts in batches and return how many were written.
 
-    return f"Daily alert check completed. {low_stock_result}. {expiry_result}."
+    Computed quantities are upserted: open items get the current quantity and
+    resolved ones are reopened. Default quantities are only used for
+    ingredients that have no item yet, so they never overwrite one.
+    """
+
+    def flush(computed, defaults):
+        ShoppingList.objects.bulk_create(
+            computed,
+            update_conflicts=True,
+            unique_fields=["family", "ingredient"],
+            update_fields=["qty_needed", "unit", "resolved_at"],
+        )
+        ShoppingList.objects.bulk_create(defaults, ignore_conflicts=True)
+        return len(computed) + len(defaults)
+
+    items_written = 0
+    computed, defaults = [], []
+    for family_id, ingredient_id, qty_needed, unit, is_computed in _shopping_needs(active_alerts):
+        # Ensure positive quantity
+        qty_needed = qty_needed.quantize(Decimal("0.01"), ROUND_HALF_UP)
+        if qty_needed <= 0:
+            continue
+        item = ShoppingList(family_id=family_id, ingredient_id=ingredient_id, qty_needed=qty_needed, unit=unit)
+        (computed if is_computed else defaults).append(item)
+        if len(computed) + len(defaults) >= SHOPPING_BATCH_SIZE:
+            items_written += flush(computed, defaults)
+            computed, defaults = [], []
+
+    return items_written + flush(computed, defaults)
 
 
 @shared_task
@@ -106,62 +346,152 @@ def generate_shopping_lists():
     """
     Generate shopping lists from active alerts
     """
-    items_created = 0
+    items_written = _upsert_shopping_items(Alert.objects.filter(is_resolved=False))
 
-    # Get all families
-    families = Family.objects.all()
+    return f"Generated {items_written} shopping list items"
 
-    for family in families:
-        # Get all active low stock and expired alerts for this family
-        active_alerts = Alert.objects.filter(family=family, is_resolved=False)
 
-        for alert in active_alerts:
-            # Check if there's already a shopping list item for this ingredient
-            existing_item = ShoppingList.objects.filter(
-                family=family, ingredient=alert.ingredient, resolved_at__isnull=True
-            ).first()
+@shared_task
+def daily_shopping_list_generation():
+    """
+    Combined daily task to generate shopping lists after alert checks
+    """
+    return _fan_out(generate_shopping=True)
 
-            if existing_item:
-                # Update quantity if there's a specific need (for now, skip)
-                continue
 
-            # Determine quantity needed based on alert type
-            if alert.alert_type == "LOW_STOCK":
-                # Try to get the threshold to know how much to buy
-                try:
-                    threshold = LowStockThreshold.objects.get(family=family, ingredient=alert.ingredient)
-                    # Buy enough to reach threshold + 50% buffer
-                    current_stock = PantryStock.objects.get(family=family, ingredient=alert.ingredient)
-                    qty_needed = (threshold.threshold_qty * Decimal("1.5")) - current_stock.qty_available
-                    unit = threshold.unit
-                except (LowStockThreshold.DoesNotExist, PantryStock.DoesNotExist):
-                    # Default to buying 1 unit if we can't determine specifics
-                    qty_needed = Decimal("1.0")
-                    unit = "unit"
-            else:  # EXPIRED
-                # For expired items, buy a standard replacement amount
-                try:
-                    expired_stock = PantryStock.objects.get(family=family, ingredient=alert.ingredient)
-                    qty_needed = expired_stock.qty_available  # Replace the expired amount
-                    unit = expired_stock.unit
-                except PantryStock.DoesNotExist:
-                    qty_needed = Decimal("1.0")
-                    unit = "unit"
-
-            # Ensure positive quantity
-            if qty_needed > 0:
-                ShoppingList.objects.create(family=family, ingredient=alert.ingredient, qty_needed=qty_needed, unit=unit)
-                items_created += 1
-
-    return f"Generated {items_created} shopping list items"
+def _order_ingredients(order_id):
+    """Return the family and ingredient ids used by an order"""
+    order = Order.objects.select_related("family").get(pk=order_id)
+    return order.family, list(order.order_ingredients.values_list("ingredient_id", flat=True))
 
 
 @shared_task
-def daily_shopping_list_generation():
+def refresh_shopping_list_for_order(order_id):
     """
-    Combined daily task to generate shopping lists after alert checks
+    Add shopping list items for alerts on the ingredients a completed order used
     """
-    alert_result = daily_alert_check()
-    shopping_result = generate_shopping_lists()
+    family, ingredient_ids = _order_ingredients(order_id)
+    active_alerts = Alert.objects.filter(family=family, ingredient_id__in=ingredient_ids, is_resolved=False)
+    items_written = _upsert_shopping_items(active_alerts)
+
+    return f"Generated {items_written} shopping list items"
 
-    return f"Daily tasks completed. {alert_result} {shopping_result}"
+
+@shared_task
+def notify_order_update(order_id):
+    """
+    Send the current state of an order to the family's WebSocket group
+    """
+    order = Order.objects.select_related("family", "cuisine", "created_by").get(pk=order_id)
+    send_order_update(order.family_id, OrderSerializer(order).data)
+
+    return f"Sent update for order {order_id}"
+
+
+def order_completed_pipeline(order):
+    """
+    Return the chain of side effects run after an order is marked DONE
+
+    The alerts of the order's ingredients, and of the substitutes they may
+    have been taken from, are evaluated first, so the shopping list refresh
+    sees the alerts the deduction raised.
+    """
+    ingredient_ids = set(order.order_ingredients.values_list("ingredient_id", flat=True))
+    closure = get_closures([order.family_id])[order.family_id]
+    ingredient_ids.update(
+        substitute_id for ingredient_id in list(ingredient_ids) for substitute_id, _ in closure.get(ingredient_id, ())
+    )
+    ingredient_ids = sorted(ingredient_ids)
+    return chain(
+        evaluate_pantry_alerts.si(order.family_id, ingredient_ids),
+        refresh_shopping_list_for_order.si(order.pk),
+        notify_order_update.si(order.pk),
+    )
+
+
+def _mark_ready(order_ids):
+    """
+    Move NEW orders to READY and tell their families to start cooking.
+
+    Rows another worker is already dispatching are skipped, and the status is
+    only changed for orders that are still NEW, so an order is announced once.
+    Returns the number of orders dispatched.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(pk__in=order_ids, status="NEW")
+            .select_related("cuisine")
+            .order_by("pk")
+        )
+        if not orders:
+            return 0
+
+        now = timezone.now()
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+            status="READY", version=F("version") + 1, updated_at=now
+        )
+
+        payloads = {}
+        for order in orders:
+            payloads.setdefault(order.family_id, []).append(
+                {
+                    "id": order.pk,
+                    "cuisine_id": order.cuisine_id,
+                    "cuisine_name": order.cuisine.name,
+                    "status": "READY",
+                    "version": order.version + 1,
+                    "scheduled_for": order.scheduled_for.isoformat(),
+                    "cook_at": order.cook_at.isoformat(),
+                }
+            )
+        for family_id, orders_data in payloads.items():
+            # The bulk update bypasses the Order post_save handler
+            family_data_changed(family_id, "orders")
+            transaction.on_commit(
+                lambda family_id=family_id, orders_data=orders_data: send_start_cooking(family_id, orders_data)
+            )
+
+    return len(orders)
+
+
+@shared_task
+def dispatch_scheduled_order(order_id):
+    """
+    Mark a scheduled order ready to cook once its cooking time has come
+    """
+    order = Order.objects.select_related("cuisine").filter(pk=order_id, status="NEW").first()
+    # Rescheduled orders get a new task; this one may have been queued for an older time
+    if order is None or order.cook_at is None or order.cook_at > timezone.now():
+        return f"Order {order_id} not due"
+
+    dispatched = _mark_ready([order_id])
+    return f"Dispatched {dispatched} scheduled orders"
+
+
+@shared_task
+def dispatch_due_orders():
+    """
+    Catch up on scheduled orders whose dispatch task was lost or delayed
+    """
+    now = timezone.now()
+    pending = Order.objects.filter(status="NEW", scheduled_for__isnull=False)
+
+    # Order.cook_at in SQL, as one scheduled_for bound per cooking time in use, so the batch only holds due orders
+    cook_times = pending.order_by().values_list("cuisine__default_time_min", flat=True).distinct()
+    is_due = Q(pk__in=[])
+    for minutes in cook_times:
+        is_due |= Q(cuisine__default_time_min=minutes, scheduled_for__lte=now + timedelta(minutes=minutes))
+    due = list(pending.filter(is_due).order_by("scheduled_for").values_list("pk", flat=True)[:DISPATCH_BATCH_SIZE])
+    dispatched = _mark_ready(due) if due else 0
+
+    return f"Dispatched {dispatched} scheduled orders"
+
+
+def schedule_order_dispatch(orders):
+    """
+    Queue a dispatch task for each scheduled order, due when cooking has to start
+    """
+    for order in orders:
+        if order.status == "NEW" and order.scheduled_for is not None:
+            dispatch_scheduled_order.apply_async((order.pk,), eta=order.cook_at)
@@ -1,5 +1,6 @@
 import json
 import asyncio
+import math
 from datetime import date, timedelta
 from decimal import Decimal
 from unittest.mock import Mock, patch
@@ -12,13 +13,17 @@ from rest_framework.test import APITestCase
 
 from .models import (
     Alert,
+    ConsumptionRate,
     Cuisine,
+    CuisineAvailability,
     Family,
     FamilyMember,
     Ingredient,
+    IngredientSubstitution,
     LowStockThreshold,
     Order,
     OrderItemIngredient,
+    PantryReservation,
     PantryStock,
     RecipeIngredient,
     ShoppingList,
@@ -313,12 +318,13 @@ class APITests(APITestCase):
         self.assertFalse(dish["is_available"])
 
         # Add sufficient stock
-        PantryStock.objects.create(
-            family=self.family,
-            ingredient=self.ingredient,
-            qty_available=Decimal("5.0"),
-            unit="pieces",
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            PantryStock.objects.create(
+                family=self.family,
+                ingredient=self.ingredient,
+                qty_available=Decimal("5.0"),
+                unit="pieces",
+            )
 
         # Test with stock - should be available
         response = self.client.get("/api/menu/")
@@ -443,12 +449,12 @@ class APITests(APITestCase):
             unit="pieces",
         )
 
-        # Create order
+        # Create order that is being cooked
         order = Order.objects.create(
             family=self.family,
             cuisine=cuisine,
             created_by=self.user,
-            status="NEW",
+            status="COOKING",
         )
 
         # Create order ingredient (this would normally be done automatically)
@@ -639,6 +645,44 @@ class ShoppingListTaskTests(TestCase):
         # Should still only have one shopping list item
         shopping_items = ShoppingList.objects.filter(family=self.family, ingredient=self.ingredient)
         self.assertEqual(shopping_items.count(), 1)
+        # Without a threshold the default quantity never overwrites the existing item
+        self.assertEqual(shopping_items.get().qty_needed, Decimal("5.0"))
+
+    def test_existing_items_refreshed(self):
+        """Test open items get the current quantity and resolved ones are reopened"""
+        from .tasks import generate_shopping_lists
+
+        LowStockThreshold.objects.create(family=self.family, ingredient=self.ingredient, threshold_qty=Decimal("2"), unit="kg")
+        PantryStock.objects.create(family=self.family, ingredient=self.ingredient, qty_available=Decimal("500"), unit="g")
+        Alert.objects.create(family=self.family, ingredient=self.ingredient, alert_type="LOW_STOCK", message="Low stock")
+        item = ShoppingList.objects.create(
+            family=self.family, ingredient=self.ingredient, qty_needed=Decimal("1"), unit="kg", resolved_at=timezone.now()
+        )
+
+        generate_shopping_lists()
+
+        item.refresh_from_db()
+        # 1.5 * 2 kg - 0.5 kg, with the pantry converted to the threshold unit
+        self.assertEqual(item.qty_needed, Decimal("2.5"))
+        self.assertIsNone(item.resolved_at)
+
+    def test_generation_query_count(self):
+        """Test generation reads alerts in one query and writes items in bulk, however many families there are"""
+        from .tasks import generate_shopping_lists
+
+        for index in range(5):
+            family = Family.objects.create(name=f"Family {index}")
+            PantryStock.objects.create(family=family, ingredient=self.ingredient, qty_available=Decimal("2"), unit="kg")
+            Alert.objects.create(family=family, ingredient=self.ingredient, alert_type="EXPIRED", message="Expired")
+            Alert.objects.create(family=family, ingredient=self.ingredient, alert_type="LOW_STOCK", message="Low stock")
+
+        # One read and one upsert; there are no default quantities to insert
+        with self.assertNumQueries(2):
+            result = generate_shopping_lists()
+
+        self.assertEqual(result, "Generated 5 shopping list items")
+        # Without a threshold the LOW_STOCK need cannot be computed, the expired amount is replaced instead
+        self.assertEqual(set(ShoppingList.objects.values_list("qty_needed", "unit")), {(Decimal("2"), "kg")})
 
 
 class AlertTests(TestCase):
@@ -676,6 +720,22 @@ class AlertTests(TestCase):
         self.assertEqual(threshold.threshold_qty, Decimal("5.0"))
         self.assertEqual(threshold.unit, "kg")
 
+    def test_one_open_alert_per_type(self):
+        """Test the database rejects a second open alert of the same type while resolved ones may repeat"""
+        from django.db import IntegrityError, transaction
+
+        fields = {"family": self.family, "ingredient": self.ingredient, "alert_type": "LOW_STOCK", "message": "Low stock"}
+        Alert.objects.create(is_resolved=True, **fields)
+        Alert.objects.create(is_resolved=True, **fields)
+        Alert.objects.create(**fields)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Alert.objects.create(**fields)
+
+        # Bulk inserts skip the duplicate instead of failing
+        Alert.objects.bulk_create([Alert(**fields), Alert(**{**fields, "alert_type": "EXPIRED"})], ignore_conflicts=True)
+        self.assertEqual(Alert.objects.filter(is_resolved=False).count(), 2)
+
 
 class AlertAPITests(APITestCase):
     """Test alert API endpoints"""
@@ -728,6 +788,27 @@ class AlertAPITests(APITestCase):
         self.assertTrue(alert.is_resolved)
         self.assertIsNotNone(alert.resolved_at)
 
+    def test_alert_update_cannot_duplicate_open_alert(self):
+        """Test reopening or retyping an alert onto an open one is rejected instead of failing the constraint"""
+        Alert.objects.create(family=self.family, ingredient=self.ingredient, alert_type="LOW_STOCK", message="Low")
+        resolved = Alert.objects.create(
+            family=self.family, ingredient=self.ingredient, alert_type="LOW_STOCK", message="Old", is_resolved=True
+        )
+        expired = Alert.objects.create(family=self.family, ingredient=self.ingredient, alert_type="EXPIRED", message="Old")
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.patch(f"/api/alerts/{resolved.id}/", {"is_resolved": False}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(f"/api/alerts/{expired.id}/", {"alert_type": "LOW_STOCK"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with patch("core.serializers.AlertSerializer.validate", side_effect=lambda attrs: attrs):
+            response = self.client.patch(f"/api/alerts/{expired.id}/", {"alert_type": "LOW_STOCK"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(f"/api/alerts/{expired.id}/", {"message": "Still expired"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_low_stock_threshold_crud(self):
         """Test low stock threshold CRUD operations"""
         self.client.force_authenticate(user=self.user)
@@ -822,6 +903,62 @@ class AlertTaskTests(TestCase):
         self.assertEqual(alerts.count(), 1)
         self.assertTrue("Created 0 low stock alerts" in result)  # Second run should create 0
 
+    def test_low_stock_check_query_count(self):
+        """Test low stock detection uses one query plus one insert regardless of the number of families"""
+        from .tasks import check_low_stock_alerts
+
+        for index in range(5):
+            family = Family.objects.create(name=f"Family {index}")
+            LowStockThreshold.objects.create(family=family, ingredient=self.ingredient, threshold_qty=Decimal("500"), unit="g")
+            # Every other family is stocked above its threshold, in a different unit than the threshold
+            qty = Decimal("0.2") if index % 2 == 0 else Decimal("2")
+            PantryStock.objects.create(family=family, ingredient=self.ingredient, qty_available=qty, unit="kg")
+        # Stock without a threshold is never scanned
+        PantryStock.objects.create(family=self.family, ingredient=self.ingredient, qty_available=Decimal("0"), unit="kg")
+
+        with self.assertNumQueries(2):
+            result = check_low_stock_alerts()
+
+        self.assertIn("Created 3 low stock alerts", result)
+        self.assertIn("scanned 5 rows", result)
+        self.assertEqual(Alert.objects.filter(alert_type="LOW_STOCK").count(), 3)
+
+    def test_expiring_soon_alert_replaced_once_expired(self):
+        """Test items expiring soon get their own alert type, superseded by EXPIRED once the date passes"""
+        from .tasks import check_expired_items
+
+        stock = PantryStock.objects.create(
+            family=self.family,
+            ingredient=self.ingredient,
+            qty_available=Decimal("5.0"),
+            unit="kg",
+            best_before=date.today() + timedelta(days=2),
+        )
+        # Far from expiry, never scanned
+        PantryStock.objects.create(
+            family=self.family,
+            ingredient=Ingredient.objects.create(name="Rice"),
+            qty_available=Decimal("1.0"),
+            unit="kg",
+            best_before=date.today() + timedelta(days=30),
+        )
+
+        with self.assertNumQueries(3):
+            result = check_expired_items()
+        self.assertIn("Created 1 expiry alerts", result)
+        warning = Alert.objects.get(family=self.family, ingredient=self.ingredient)
+        self.assertEqual(warning.alert_type, "EXPIRING_SOON")
+        self.assertIn("Expiring soon: Tomato expires in 2 day(s)", warning.message)
+
+        stock.best_before = date.today()
+        stock.save()
+        self.assertIn("Created 1 expiry alerts", check_expired_items())
+        self.assertIn("Created 0 expiry alerts", check_expired_items())
+
+        warning.refresh_from_db()
+        self.assertTrue(warning.is_resolved)
+        self.assertTrue(Alert.objects.filter(ingredient=self.ingredient, alert_type="EXPIRED", is_resolved=False).exists())
+
 
 class PWATests(TestCase):
     """Test PWA functionality and features"""
@@ -1264,3 +1401,1444 @@ class CeleryTaskTests(TestCase):
 
         self.assertIsNotNone(shopping_item)
         self.assertFalse(shopping_item.is_resolved)
+
+    def test_daily_pipeline_fans_out_over_family_shards(self):
+        """Test the daily pipeline runs one task per family shard and covers every family"""
+        from core import tasks
+
+        other_family = Family.objects.create(name="Other Family")
+        PantryStock.objects.create(
+            family=other_family,
+            ingredient=self.ingredient,
+            qty_available=Decimal("1"),
+            unit="kg",
+            best_before=date.today() - timedelta(days=1),
+        )
+
+        # One family per shard; the chord runs in-process as CELERY_TASK_ALWAYS_EAGER is on in tests
+        with patch("core.tasks.FAMILY_SHARD_SIZE", 1):
+            result = tasks.daily_shopping_list_generation()
+
+        self.assertEqual(result, "Dispatched 2 family shards")
+        self.assertTrue(Alert.objects.filter(family=self.family, alert_type="LOW_STOCK").exists())
+        self.assertTrue(Alert.objects.filter(family=other_family, alert_type="EXPIRED").exists())
+        self.assertEqual(ShoppingList.objects.filter(family__in=[self.family, other_family]).count(), 2)
+
+    def test_family_shard_summary(self):
+        """Test the chord callback adds up the counts of every shard"""
+        from core.tasks import summarize_family_shards
+
+        results = [
+            {"low_stock_alerts": 1, "expiry_alerts": 0, "shopping_items": 1},
+            {"low_stock_alerts": 2, "expiry_alerts": 3, "shopping_items": 4},
+        ]
+        self.assertEqual(
+            summarize_family_shards(results, generate_shopping=True),
+            "Daily tasks completed. Daily alert check completed. Created 3 low stock alerts. "
+            "Created 3 expiry alerts. Generated 5 shopping list items",
+        )
+
+
+class MenuAvailabilityTests(APITestCase):
+    """Test the batched menu availability engine"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+
+        self.flour = Ingredient.objects.create(name="Flour")
+        self.egg = Ingredient.objects.create(name="Egg")
+        PantryStock.objects.create(family=self.family, ingredient=self.flour, qty_available=Decimal("500"), unit="g")
+
+    def _create_cuisine(self, name, *requirements):
+        cuisine = Cuisine.objects.create(name=name, default_time_min=10, created_by=self.user, family=self.family)
+        for ingredient, quantity, options in requirements:
+            RecipeIngredient.objects.create(cuisine=cuisine, ingredient=ingredient, quantity=quantity, unit="g", **options)
+        return cuisine
+
+    def test_compute_availability_rules(self):
+        """Test optional and substitutable ingredients follow the availability rules"""
+        from .availability import compute_availability
+
+        enough = self._create_cuisine("Enough", (self.flour, Decimal("200"), {}))
+        too_much = self._create_cuisine("Too Much", (self.flour, Decimal("800"), {}))
+        missing = self._create_cuisine("Missing", (self.egg, Decimal("1"), {}))
+        optional = self._create_cuisine(
+            "Optional", (self.flour, Decimal("100"), {}), (self.egg, Decimal("1"), {"is_optional": True})
+        )
+        substitutable = self._create_cuisine("Substitutable", (self.egg, Decimal("1"), {"is_substitutable": True}))
+        empty = self._create_cuisine("Empty")
+
+        with self.assertNumQueries(2):
+            availability = compute_availability([enough, too_much, missing, optional, substitutable, empty])
+
+        self.assertTrue(availability[enough.id])
+        self.assertFalse(availability[too_much.id])
+        self.assertFalse(availability[missing.id])
+        self.assertTrue(availability[optional.id])
+        self.assertFalse(availability[substitutable.id])  # No substitute configured
+        self.assertTrue(availability[empty.id])
+
+        for cuisine in [enough, too_much, missing, optional, substitutable, empty]:
+            self.assertEqual(cuisine.is_available(), availability[cuisine.id])
+
+    def test_moved_rows_refresh_their_old_cuisines(self):
+        """Test moving a pantry row or a recipe ingredient refreshes availability for the old values too"""
+        bread = self._create_cuisine("Bread", (self.flour, Decimal("200"), {}))
+        omelette = self._create_cuisine("Omelette", (self.egg, Decimal("50"), {}))
+        stock = PantryStock.objects.get(ingredient=self.flour)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.patch(f"/api/pantry-stock/{stock.id}/", {"ingredient_id": self.egg.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for cuisine in (bread, omelette):
+            cuisine.availability.refresh_from_db()
+            self.assertEqual(cuisine.availability.is_available, cuisine.is_available())
+        self.assertFalse(bread.availability.is_available)
+        self.assertTrue(omelette.availability.is_available)
+
+        # Moving the egg requirement to bread makes the omelette an empty recipe and bread needs eggs too
+        requirement = RecipeIngredient.objects.get(cuisine=omelette)
+        requirement.cuisine = bread
+        requirement.save()
+        RecipeIngredient.objects.filter(cuisine=bread, ingredient=self.flour).delete()
+        omelette.availability.refresh_from_db()
+        bread.availability.refresh_from_db()
+        self.assertTrue(omelette.availability.is_available)
+        self.assertTrue(bread.availability.is_available)
+
+    def test_menu_query_count_is_constant(self):
+        """Test the menu costs the same number of queries for few or many cuisines"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_authenticate(user=self.user)
+        self._create_cuisine("Dish 0", (self.flour, Decimal("100"), {}), (self.egg, Decimal("2"), {}))
+
+        with CaptureQueriesContext(connection) as small_menu:
+            response = self.client.get("/api/menu/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(1, 15):
+                self._create_cuisine(f"Dish {index}", (self.flour, Decimal("100"), {}), (self.egg, Decimal("2"), {}))
+
+        with CaptureQueriesContext(connection) as large_menu:
+            response = self.client.get("/api/menu/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 15)
+        self.assertEqual(len(large_menu), len(small_menu))
+
+    def test_servings_possible(self):
+        """Test servings are the minimum over required ingredients and exposed by the menu"""
+        from .availability import compute_menu_status
+
+        PantryStock.objects.create(family=self.family, ingredient=self.egg, qty_available=Decimal("7"), unit="g")
+        pancakes = self._create_cuisine("Pancakes", (self.flour, Decimal("100"), {}), (self.egg, Decimal("2"), {}))
+        bread = self._create_cuisine(
+            "Bread", (self.flour, Decimal("300"), {}), (self.egg, Decimal("9"), {"is_optional": True})
+        )
+        feast = self._create_cuisine("Feast", (self.flour, Decimal("600"), {}))
+        salad = self._create_cuisine("Salad")
+
+        with self.assertNumQueries(2):
+            statuses = compute_menu_status([pancakes, bread, feast, salad])
+
+        self.assertEqual(statuses[pancakes.id].servings_possible, 3)  # 7 eggs / 2
+        self.assertEqual(statuses[bread.id].servings_possible, 1)  # 500 g / 300 g, eggs optional
+        self.assertEqual(statuses[feast.id].servings_possible, 0)
+        self.assertFalse(statuses[feast.id].is_available)
+        self.assertIsNone(statuses[salad.id].servings_possible)
+        self.assertTrue(statuses[salad.id].is_available)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get("/api/menu/")
+        servings = {item["name"]: item["servings_possible"] for item in response.json()["results"]}
+        self.assertEqual(servings, {"Pancakes": 3, "Bread": 1, "Feast": 0, "Salad": None})
+
+    def test_available_filter_and_ordering(self):
+        """Test available=true and ordering=-available are evaluated in the database"""
+        from importlib import import_module
+
+        from django.apps import apps
+
+        from .models import CuisineAvailability
+
+        self.client.force_authenticate(user=self.user)
+        for index in range(12):
+            self._create_cuisine(f"Missing {index:02}", (self.egg, Decimal("1"), {}))
+            self._create_cuisine(f"Ready {index:02}", (self.flour, Decimal("100"), {}))
+        # Rows lost before the table was maintained are backfilled by the migration, with the quantity rules
+        short = self._create_cuisine("Short", (self.flour, Decimal("600"), {}))
+        CuisineAvailability.objects.filter(cuisine__name__in=["Missing 00", "Ready 00", "Short"]).delete()
+        import_module("core.migrations.0018_backfill_cuisine_availability").backfill_cuisine_availability(apps, None)
+        self.assertFalse(CuisineAvailability.objects.get(cuisine=short).is_available)
+        short.delete()
+
+        response = self.client.get("/api/menu/?available=true")
+        self.assertEqual(response.json()["count"], 12)
+        self.assertTrue(all(item["is_available"] for item in response.json()["results"]))
+
+        response = self.client.get("/api/menu/?available=false")
+        self.assertEqual(response.json()["count"], 12)
+        self.assertFalse(any(item["is_available"] for item in response.json()["results"]))
+
+        names = [item["name"] for item in self.client.get("/api/menu/?ordering=-available").json()["results"]]
+        self.assertEqual(names[:12], [f"Ready {index:02}" for index in range(12)])
+        self.assertEqual(names[12:], [f"Missing {index:02}" for index in range(8)])
+
+        response = self.client.get("/api/menu/?available=maybe")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CuisineAvailabilityTableTests(TestCase):
+    """Test the incrementally maintained availability table"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        self.flour = Ingredient.objects.create(name="Flour")
+        self.egg = Ingredient.objects.create(name="Egg")
+
+        self.bread = Cuisine.objects.create(name="Bread", default_time_min=60, created_by=self.user, family=self.family)
+        RecipeIngredient.objects.create(cuisine=self.bread, ingredient=self.flour, quantity=Decimal("300"), unit="g")
+        self.omelette = Cuisine.objects.create(name="Omelette", default_time_min=5, created_by=self.user, family=self.family)
+        RecipeIngredient.objects.create(cuisine=self.omelette, ingredient=self.egg, quantity=Decimal("2"), unit="pieces")
+
+    def _stored(self, cuisine):
+        return CuisineAvailability.objects.get(cuisine=cuisine).is_available
+
+    def test_table_follows_pantry_and_recipe_changes(self):
+        """Test pantry and recipe writes update the stored flag"""
+        self.assertFalse(self._stored(self.bread))
+
+        stock = PantryStock.objects.create(family=self.family, ingredient=self.flour, qty_available=Decimal("500"), unit="g")
+        self.assertTrue(self._stored(self.bread))
+        self.assertFalse(self._stored(self.omelette))
+
+        RecipeIngredient.objects.filter(cuisine=self.bread).update(quantity=Decimal("600"))
+        RecipeIngredient.objects.get(cuisine=self.bread).save()
+        self.assertFalse(self._stored(self.bread))
+
+        stock.qty_available = Decimal("1000")
+        stock.save()
+        self.assertTrue(self._stored(self.bread))
+
+        stock.delete()
+        self.assertFalse(self._stored(self.bread))
+
+    def test_only_cuisines_using_the_ingredient_are_recomputed(self):
+        """Test a pantry write leaves cuisines using other ingredients untouched"""
+        omelette_updated_at = CuisineAvailability.objects.get(cuisine=self.omelette).updated_at
+
+        PantryStock.objects.create(family=self.family, ingredient=self.flour, qty_available=Decimal("500"), unit="g")
+
+        self.assertEqual(CuisineAvailability.objects.get(cuisine=self.omelette).updated_at, omelette_updated_at)
+
+    def test_cuisine_deletion_removes_row(self):
+        """Test deleting a cuisine with ingredients does not leave an availability row behind"""
+        self.bread.delete()
+        self.assertFalse(CuisineAvailability.objects.filter(cuisine_id=self.bread.id).exists())
+        self.assertTrue(CuisineAvailability.objects.filter(cuisine=self.omelette).exists())
+
+    def test_rebuild_command_detects_and_fixes_drift(self):
+        """Test the management command reports drift and rebuilds the table"""
+        from io import StringIO
+
+        from django.core.management import CommandError, call_command
+
+        CuisineAvailability.objects.filter(cuisine=self.bread).update(is_available=True)
+        CuisineAvailability.objects.filter(cuisine=self.omelette).delete()
+
+        with self.assertRaisesMessage(CommandError, "2 of 2 cuisines have drifted"):
+            call_command("rebuild_availability", "--check", stdout=StringIO())
+
+        call_command("rebuild_availability", stdout=StringIO())
+
+        output = StringIO()
+        call_command("rebuild_availability", "--check", stdout=output)
+        self.assertIn("No drift found in 2 cuisines", output.getvalue())
+        self.assertFalse(self._stored(self.bread))
+
+
+class UnitConversionTests(APITestCase):
+    """Test the unit registry and its use in availability, deduction and alerts"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.flour = Ingredient.objects.create(name="Flour")
+        self.milk = Ingredient.objects.create(name="Milk", density=Decimal("1.03"))
+
+    def test_convert(self):
+        """Test conversions within a dimension, through density and between incompatible units"""
+        from .units import convert
+
+        self.assertEqual(convert(Decimal("1.5"), "kg", "g"), Decimal("1500"))
+        self.assertEqual(convert(Decimal("250"), "G", "Kg"), Decimal("0.25"))
+        self.assertEqual(convert(Decimal("2"), "dozen", "pieces"), Decimal("24"))
+        self.assertEqual(convert(Decimal("3"), "cloves", "cloves"), Decimal("3"))
+        self.assertEqual(convert(Decimal("1"), "l", "g", density=Decimal("1.03")), Decimal("1030"))
+        self.assertEqual(convert(Decimal("103"), "g", "ml", density=Decimal("1.03")), Decimal("100"))
+        self.assertIsNone(convert(Decimal("1"), "l", "g"))
+        self.assertIsNone(convert(Decimal("1"), "kg", "pieces"))
+        self.assertIsNone(convert(Decimal("1"), "cloves", "pieces"))
+
+    def test_availability_converts_units(self):
+        """Test a recipe in grams is checked against a pantry stocked in kilograms"""
+        cake = Cuisine.objects.create(name="Cake", default_time_min=45, created_by=self.user, family=self.family)
+        RecipeIngredient.objects.create(cuisine=cake, ingredient=self.flour, quantity=Decimal("400"), unit="g")
+        RecipeIngredient.objects.create(cuisine=cake, ingredient=self.milk, quantity=Decimal("250"), unit="ml")
+        PantryStock.objects.create(family=self.family, ingredient=self.flour, qty_available=Decimal("1.0"), unit="kg")
+        PantryStock.objects.create(family=self.family, ingredient=self.milk, qty_available=Decimal("0.6"), unit="kg")
+
+        # 1000 g / 400 g = 2 servings, 600 g / (250 ml * 1.03 g/ml) = 2 servings
+        cake.availability.refresh_from_db()
+        self.assertTrue(cake.availability.is_available)
+        self.assertEqual(cake.availability.servings_possible, 2)
+
+        PantryStock.objects.filter(ingredient=self.flour).update(unit="pieces")
+        self.assertFalse(cake.is_available())
+
+    def test_density_change_refreshes_availability(self):
+        """Test editing an ingredient's density recomputes the stored availability of recipes using it"""
+        latte = Cuisine.objects.create(name="Latte", default_time_min=5, created_by=self.user, family=self.family)
+        RecipeIngredient.objects.create(cuisine=latte, ingredient=self.milk, quantity=Decimal("500"), unit="ml")
+        PantryStock.objects.create(family=self.family, ingredient=self.milk, qty_available=Decimal("0.6"), unit="kg")
+
+        # 600 g / (500 ml * 1.03 g/ml) = 1 serving
+        latte.availability.refresh_from_db()
+        self.assertEqual(latte.availability.servings_possible, 1)
+
+        self.milk.density = Decimal("0.5")
+        self.milk.save()
+
+        # 600 g / (500 ml * 0.5 g/ml) = 2 servings
+        latte.availability.refresh_from_db()
+        self.assertEqual(latte.availability.servings_possible, 2)
+
+    def test_deduction_converts_units(self):
+        """Test completing an order deducts recipe grams from a pantry kept in kilograms"""
+        self.client.force_authenticate(user=self.user)
+        cake = Cuisine.objects.create(name="Cake", default_time_min=45, created_by=self.user, family=self.family)
+        stock = PantryStock.objects.create(family=self.family, ingredient=self.flour, qty_available=Decimal("2.0"), unit="kg")
+        order = Order.objects.create(family=self.family, cuisine=cake, created_by=self.user, status="COOKING")
+        OrderItemIngredient.objects.create(order=order, ingredient=self.flour, quantity=Decimal("400"), unit="g")
+
+        response = self.client.patch(f"/api/orders/{order.id}/update_status/", {"status": "DONE"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        stock.refresh_from_db()
+        self.assertEqual(stock.qty_available, Decimal("1.6"))
+
+    def test_low_stock_alert_converts_units(self):
+        """Test a threshold in grams is compared against a pantry kept in kilograms"""
+        from .tasks import check_low_stock_alerts
+
+        LowStockThreshold.objects.create(family=self.family, ingredient=self.flour, threshold_qty=Decimal("500"), unit="g")
+        PantryStock.objects.create(family=self.family, ingredient=self.flour, qty_available=Decimal("0.4"), unit="kg")
+
+        result = check_low_stock_alerts()
+
+        self.assertIn("Created 1 low stock alerts", result)
+        self.assertTrue(Alert.objects.filter(family=self.family, ingredient=self.flour, alert_type="LOW_STOCK").exists())
+
+
+class IngredientSubstitutionTests(APITestCase):
+    """Test availability resolved through the substitution graph"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        self.other_family = Family.objects.create(name="Other Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+
+        self.butter = Ingredient.objects.create(name="Butter")
+        self.margarine = Ingredient.objects.create(name="Margarine")
+        self.oil = Ingredient.objects.create(name="Oil")
+
+        self.cookies = Cuisine.objects.create(name="Cookies", default_time_min=20, created_by=self.user, family=self.family)
+        RecipeIngredient.objects.create(
+            cuisine=self.cookies, ingredient=self.butter, quantity=Decimal("100"), unit="g", is_substitutable=True
+        )
+        PantryStock.objects.create(family=self.family, ingredient=self.oil, qty_available=Decimal("500"), unit="g")
+
+    def tearDown(self):
+        from django.core.cache import cache
+
+        # Closures are cached by family id, which the next test may reuse
+        cache.clear()
+
+    def _stored(self):
+        return CuisineAvailability.objects.get(cuisine=self.cookies)
+
+    def test_transitive_substitution_with_ratio(self):
+        """Test butter -> margarine -> oil resolves with the multiplied ratio"""
+        from .substitutions import get_closures
+
+        self.assertFalse(self._stored().is_available)
+
+        IngredientSubstitution.objects.create(ingredient=self.butter, substitute=self.margarine, ratio=Decimal("1"))
+        self.assertFalse(self._stored().is_available)
+
+        IngredientSubstitution.objects.create(
+            ingredient=self.margarine, substitute=self.oil, ratio=Decimal("0.8"), family=self.family
+        )
+        # 500 g of oil / (100 g * 1 * 0.8) = 6 servings
+        self.assertTrue(self._stored().is_available)
+        self.assertEqual(self._stored().servings_possible, 6)
+
+        closure = get_closures([self.family.id, self.other_family.id])
+        self.assertEqual(dict(closure[self.family.id][self.butter.id]), {self.margarine.id: 1, self.oil.id: Decimal("0.8")})
+        self.assertEqual(dict(closure[self.other_family.id][self.butter.id]), {self.margarine.id: 1})
+
+    def test_closure_is_cached_and_invalidated(self):
+        """Test menu checks do not query substitutions until a row changes"""
+        from .availability import compute_menu_status
+
+        substitution = IngredientSubstitution.objects.create(ingredient=self.butter, substitute=self.oil, family=self.family)
+
+        with self.assertNumQueries(2):
+            self.assertTrue(compute_menu_status([self.cookies])[self.cookies.id].is_available)
+
+        substitution.delete()
+        self.assertFalse(self._stored().is_available)
+        with self.assertNumQueries(2):
+            self.assertFalse(compute_menu_status([self.cookies])[self.cookies.id].is_available)
+
+    def test_closure_is_dropped_again_after_commit(self):
+        """Test a closure cached by a concurrent read before the commit is not served afterwards"""
+        from django.core.cache import cache
+
+        from .substitutions import _closure_key, _global_version, get_closures
+
+        get_closures([self.family.id])
+        with self.captureOnCommitCallbacks() as callbacks:
+            IngredientSubstitution.objects.create(ingredient=self.butter, substitute=self.oil, family=self.family)
+            # A reader outside the transaction caches the graph it can still see
+            cache.set(_closure_key(self.family.id, _global_version()), {})
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(dict(get_closures([self.family.id])[self.family.id][self.butter.id]), {self.oil.id: 1})
+
+    def test_global_invalidation_survives_evicted_version(self):
+        """Test a version key evicted between add() and incr() is recreated instead of raising"""
+        from django.core.cache import cache
+
+        from .substitutions import GLOBAL_VERSION_KEY, invalidate_closures
+
+        with patch("core.substitutions.cache.incr", side_effect=ValueError):
+            invalidate_closures()
+        self.assertEqual(cache.get(GLOBAL_VERSION_KEY), 1)
+
+    def test_orders_reserve_and_deduct_the_substitute(self):
+        """Test a cuisine made from a substitute holds and then uses up the substitute's stock"""
+        IngredientSubstitution.objects.create(
+            ingredient=self.butter, substitute=self.oil, ratio=Decimal("0.8"), family=self.family
+        )
+        oil_stock = PantryStock.objects.get(ingredient=self.oil)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post("/api/orders/", {"family_id": self.family.id, "cuisine_id": self.cookies.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order_id = response.json()["id"]
+        oil_stock.refresh_from_db()
+        self.assertEqual(oil_stock.qty_reserved, Decimal("80"))
+        # (500 g - 80 g held) / 80 g = 5 servings
+        self.assertEqual(self._stored().servings_possible, 5)
+
+        for new_status in ("COOKING", "DONE"):
+            response = self.client.patch(f"/api/orders/{order_id}/update_status/", {"status": new_status})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        oil_stock.refresh_from_db()
+        self.assertEqual(oil_stock.qty_available, Decimal("420"))
+        self.assertEqual(oil_stock.qty_reserved, Decimal("0"))
+        self.assertEqual(self._stored().servings_possible, 5)
+
+    def test_global_substitutions_require_staff(self):
+        """Test only staff can create substitutions shared by all families"""
+        self.client.force_authenticate(user=self.user)
+        data = {"ingredient_id": self.butter.id, "substitute_id": self.oil.id, "ratio": "0.8"}
+
+        response = self.client.post("/api/ingredient-substitutions/", data)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.post("/api/ingredient-substitutions/", {**data, "family_id": self.family.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(self._stored().is_available)
+
+    def test_family_substitutions_require_membership(self):
+        """Test substitutions cannot be created in, or moved to, a family the user does not belong to"""
+        self.client.force_authenticate(user=self.user)
+        data = {"ingredient_id": self.butter.id, "substitute_id": self.oil.id, "family_id": self.other_family.id}
+
+        response = self.client.post("/api/ingredient-substitutions/", data)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(IngredientSubstitution.objects.exists())
+
+        substitution = IngredientSubstitution.objects.create(ingredient=self.butter, substitute=self.oil, family=self.family)
+        response = self.client.patch(
+            f"/api/ingredient-substitutions/{substitution.id}/", {"family_id": self.other_family.id}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        substitution.refresh_from_db()
+        self.assertEqual(substitution.family_id, self.family.id)
+
+
+class ConditionalRequestTests(APITestCase):
+    """Test ETag / If-None-Match support driven by per-family versions"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.ingredient = Ingredient.objects.create(name="Rice")
+        self.cuisine = Cuisine.objects.create(name="Fried Rice", default_time_min=15, created_by=self.user, family=self.family)
+        RecipeIngredient.objects.create(cuisine=self.cuisine, ingredient=self.ingredient, quantity=Decimal("200"), unit="g")
+        self.client.force_authenticate(user=self.user)
+
+    def test_not_modified_skips_queryset(self):
+        """Test a matching If-None-Match is answered with 304 using only the version lookup"""
+        response = self.client.get("/api/menu/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('W/"menu-'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/menu/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+        response = self.client.get(f"/api/menu/{self.cuisine.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_writes_change_only_affected_etags(self):
+        """Test pantry writes change the pantry and menu ETags while orders keep theirs"""
+        etags = {
+            endpoint: self.client.get(endpoint)["ETag"] for endpoint in ["/api/menu/", "/api/orders/", "/api/pantry-stock/"]
+        }
+
+        PantryStock.objects.create(family=self.family, ingredient=self.ingredient, qty_available=Decimal("1"), unit="kg")
+
+        for endpoint, expected_status in [
+            ("/api/menu/", status.HTTP_200_OK),
+            ("/api/pantry-stock/", status.HTTP_200_OK),
+            ("/api/orders/", status.HTTP_304_NOT_MODIFIED),
+        ]:
+            response = self.client.get(endpoint, HTTP_IF_NONE_MATCH=etags[endpoint])
+            self.assertEqual(response.status_code, expected_status, endpoint)
+
+        Order.objects.create(family=self.family, cuisine=self.cuisine, created_by=self.user)
+        response = self.client.get("/api/orders/", HTTP_IF_NONE_MATCH=etags["/api/orders/"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["results"]), 1)
+
+
+class MenuCacheTests(APITestCase):
+    """Test the serialized menu payload cache"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.admin = User.objects.create_user(username="admin", password="testpass123", is_staff=True)
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.ingredient = Ingredient.objects.create(name="Noodles")
+        cuisine = Cuisine.objects.create(name="Ramen", default_time_min=15, created_by=self.user, family=self.family)
+        RecipeIngredient.objects.create(cuisine=cuisine, ingredient=self.ingredient, quantity=Decimal("100"), unit="g")
+
+    def _stats(self):
+        from . import menu_cache
+
+        return menu_cache.get_stats()
+
+    def test_hits_skip_serialization_and_writes_invalidate(self):
+        """Test repeated reads are served from the cache until the pantry changes"""
+        self.client.force_authenticate(user=self.user)
+        before = self._stats()
+
+        response = self.client.get("/api/menu/")
+        self.assertFalse(response.json()["results"][0]["is_available"])
+
+        with patch("core.views.MenuViewSet.get_serializer") as get_serializer:
+            response = self.client.get("/api/menu/")
+        get_serializer.assert_not_called()
+        self.assertEqual(response.json()["results"][0]["name"], "Ramen")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PantryStock.objects.create(family=self.family, ingredient=self.ingredient, qty_available=Decimal("1"), unit="kg")
+        response = self.client.get("/api/menu/")
+        self.assertTrue(response.json()["results"][0]["is_available"])
+
+        after = self._stats()
+        self.assertEqual(after["hits"] - before["hits"], 1)
+        self.assertEqual(after["misses"] - before["misses"], 2)
+
+    def test_generation_is_bumped_after_commit(self):
+        """Test a read racing an uncommitted write cannot cache stale data under the new generation"""
+        self.client.force_authenticate(user=self.user)
+        self.client.get("/api/menu/")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            PantryStock.objects.create(family=self.family, ingredient=self.ingredient, qty_available=Decimal("1"), unit="kg")
+            with patch("core.views.MenuViewSet.get_serializer") as get_serializer:
+                self.client.get("/api/menu/")
+            get_serializer.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        response = self.client.get("/api/menu/")
+        self.assertTrue(response.json()["results"][0]["is_available"])
+
+    def test_pages_are_cached_separately(self):
+        """Test each page and query string gets its own cache entry"""
+        self.client.force_authenticate(user=self.user)
+        for index in range(25):
+            Cuisine.objects.create(name=f"Dish {index}", default_time_min=5, created_by=self.user, family=self.family)
+
+        first_page = self.client.get("/api/menu/").json()
+        second_page = self.client.get("/api/menu/?page=2").json()
+
+        self.assertEqual(len(first_page["results"]), 20)
+        self.assertEqual(len(second_page["results"]), 6)
+        self.assertEqual(self.client.get("/api/menu/?page=2").json(), second_page)
+
+    def test_cache_stats_requires_staff(self):
+        """Test the hit and miss counters are only exposed to staff"""
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get("/api/menu/cache-stats/").status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get("/api/menu/cache-stats/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.json()), {"hits", "misses", "hit_rate"})
+
+
+class OrderCreationTests(APITestCase):
+    """Test the order creation pipeline"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.client.force_authenticate(user=self.user)
+
+    def _create_cuisine(self, name, ingredient_count):
+        cuisine = Cuisine.objects.create(name=name, default_time_min=10, created_by=self.user, family=self.family)
+        for index in range(ingredient_count):
+            ingredient = Ingredient.objects.create(name=f"{name} ingredient {index}")
+            RecipeIngredient.objects.create(cuisine=cuisine, ingredient=ingredient, quantity=Decimal("1.5"), unit="g")
+        return cuisine
+
+    def _post_order(self, cuisine):
+        return self.client.post("/api/orders/", {"family_id": self.family.id, "cuisine_id": cuisine.id})
+
+    def test_query_count_is_constant(self):
+        """Benchmark: creating an order costs the same queries for small and large recipes"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        small = self._create_cuisine("Small", 1)
+        large = self._create_cuisine("Large", 25)
+
+        with CaptureQueriesContext(connection) as small_order:
+            response = self._post_order(small)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with CaptureQueriesContext(connection) as large_order:
+            response = self._post_order(large)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()["order_ingredients"]), 25)
+        self.assertEqual(len(response.json()["cuisine"]["recipe_ingredients"]), 25)
+
+        self.assertEqual(len(large_order), len(small_order))
+        self.assertEqual(OrderItemIngredient.objects.filter(order_id=response.json()["id"]).count(), 25)
+
+    def test_notification_is_sent_after_commit(self):
+        """Test the compact WebSocket payload is only sent once the order is committed"""
+        cuisine = self._create_cuisine("Soup", 2)
+
+        with patch("core.views.send_order_update") as send_order_update:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self._post_order(cuisine)
+            send_order_update.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        send_order_update.assert_called_once()
+        family_id, payload = send_order_update.call_args.args
+        self.assertEqual(family_id, self.family.id)
+        self.assertEqual(payload["id"], response.json()["id"])
+        self.assertEqual(payload["cuisine_name"], "Soup")
+        self.assertEqual(payload["created_by"], "testuser")
+        self.assertEqual([item["quantity"] for item in payload["order_ingredients"]], ["1.50", "1.50"])
+
+
+class PantryDeductionTests(APITestCase):
+    """Test the transactional pantry deduction on order completion"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.flour = Ingredient.objects.create(name="Flour")
+        self.egg = Ingredient.objects.create(name="Egg")
+        self.cake = Cuisine.objects.create(name="Cake", default_time_min=45, created_by=self.user, family=self.family)
+        self.flour_stock = PantryStock.objects.create(
+            family=self.family, ingredient=self.flour, qty_available=Decimal("1.0"), unit="kg"
+        )
+        self.egg_stock = PantryStock.objects.create(
+            family=self.family, ingredient=self.egg, qty_available=Decimal("2"), unit="pieces"
+        )
+        self.order = Order.objects.create(family=self.family, cuisine=self.cake, created_by=self.user, status="COOKING")
+        OrderItemIngredient.objects.create(order=self.order, ingredient=self.flour, quantity=Decimal("250"), unit="g")
+        OrderItemIngredient.objects.create(order=self.order, ingredient=self.egg, quantity=Decimal("3"), unit="pieces")
+
+    def test_deduction_clamps_at_zero_and_is_idempotent(self):
+        """Test completing an order twice deducts once and never goes negative"""
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.patch(f"/api/orders/{self.order.id}/update_status/", {"status": "DONE"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(response.json()["stock_deducted_at"])
+        response = self.client.patch(f"/api/orders/{self.order.id}/update_status/", {"status": "DONE"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        from .pantry import deduct_order_ingredients
+
+        self.assertFalse(deduct_order_ingredients(self.order))
+
+        self.flour_stock.refresh_from_db()
+        self.egg_stock.refresh_from_db()
+        self.assertEqual(self.flour_stock.qty_available, Decimal("0.75"))
+        self.assertEqual(self.egg_stock.qty_available, Decimal("0"))
+
+    def test_deduction_query_count_is_constant(self):
+        """Test the deduction costs the same queries however many ingredients the order uses"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from .pantry import deduct_order_ingredients
+
+        with CaptureQueriesContext(connection) as two_ingredients:
+            self.assertTrue(deduct_order_ingredients(self.order))
+
+        order = Order.objects.create(family=self.family, cuisine=self.cake, created_by=self.user)
+        for index in range(10):
+            ingredient = Ingredient.objects.create(name=f"Spice {index}")
+            PantryStock.objects.create(family=self.family, ingredient=ingredient, qty_available=Decimal("5"), unit="g")
+            OrderItemIngredient.objects.create(order=order, ingredient=ingredient, quantity=Decimal("1"), unit="g")
+
+        with CaptureQueriesContext(connection) as ten_ingredients:
+            self.assertTrue(deduct_order_ingredients(order))
+
+        self.assertEqual(len(ten_ingredients), len(two_ingredients))
+        self.assertEqual(
+            set(PantryStock.objects.filter(ingredient__name__startswith="Spice").values_list("qty_available", flat=True)),
+            {Decimal("4")},
+        )
+
+    def test_deduction_refreshes_availability(self):
+        """Test the bulk update keeps the availability table in sync although it bypasses signals"""
+        from .pantry import deduct_order_ingredients
+
+        RecipeIngredient.objects.create(cuisine=self.cake, ingredient=self.egg, quantity=Decimal("1"), unit="pieces")
+        self.cake.availability.refresh_from_db()
+        self.assertTrue(self.cake.availability.is_available)
+
+        deduct_order_ingredients(self.order)
+        self.cake.availability.refresh_from_db()
+        self.assertFalse(self.cake.availability.is_available)
+
+
+class OrderBatchTests(APITestCase):
+    """Test placing several orders in one request"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="member")
+        self.other_family = Family.objects.create(name="Other Family")
+        self.rice = Ingredient.objects.create(name="Rice")
+        self.cuisines = []
+        for name in ["Curry", "Pilaf", "Risotto"]:
+            cuisine = Cuisine.objects.create(name=name, default_time_min=20, created_by=self.user, family=self.family)
+            RecipeIngredient.objects.create(cuisine=cuisine, ingredient=self.rice, quantity=Decimal("150"), unit="g")
+            self.cuisines.append(cuisine)
+        self.client.force_authenticate(user=self.user)
+
+    def _post_batch(self, entries, family=None):
+        data = {"family_id": (family or self.family).id, "orders": entries}
+        return self.client.post("/api/orders/batch/", data, format="json")
+
+    def test_batch_creates_orders_and_snapshots(self):
+        """Test a batch inserts every order with its snapshots and sends one message"""
+        scheduled_for = (timezone.now() + timedelta(hours=1)).isoformat()
+        entries = [{"cuisine_id": cuisine.id, "scheduled_for": scheduled_for} for cuisine in self.cuisines]
+
+        with patch("core.views.send_orders_created") as send_orders_created:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self._post_batch(entries + [{"cuisine_id": self.cuisines[0].id}])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([order["cuisine"]["name"] for order in response.json()], ["Curry", "Pilaf", "Risotto", "Curry"])
+        self.assertEqual(Order.objects.filter(family=self.family).count(), 4)
+        self.assertEqual(OrderItemIngredient.objects.filter(order__family=self.family).count(), 4)
+
+        send_orders_created.assert_called_once()
+        family_id, payload = send_orders_created.call_args.args
+        self.assertEqual(family_id, self.family.id)
+        self.assertEqual(len(payload), 4)
+        self.assertIsNone(payload[3]["scheduled_for"])
+
+    def test_batch_query_count_is_constant(self):
+        """Test a batch costs the same number of queries for one or many orders"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as one_order:
+            self._post_batch([{"cuisine_id": self.cuisines[0].id}])
+        with CaptureQueriesContext(connection) as many_orders:
+            self._post_batch([{"cuisine_id": cuisine.id} for cuisine in self.cuisines * 5])
+
+        self.assertEqual(len(many_orders), len(one_order))
+
+    def test_batch_is_validated_as_a_whole(self):
+        """Test one invalid entry rejects the whole batch"""
+        foreign = Cuisine.objects.create(name="Foreign", default_time_min=5, created_by=self.user, family=self.other_family)
+
+        response = self._post_batch([{"cuisine_id": self.cuisines[0].id}, {"cuisine_id": foreign.id}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("orders", response.json())
+
+        response = self._post_batch([{"cuisine_id": foreign.id}], family=self.other_family)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("family_id", response.json())
+
+        self.assertEqual(self._post_batch([]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+
+class PrepListTests(APITestCase):
+    """Test the aggregated prep list of open orders"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.flour = Ingredient.objects.create(name="Flour")
+        self.egg = Ingredient.objects.create(name="Egg")
+        self.cake = Cuisine.objects.create(name="Cake", default_time_min=45, created_by=self.user, family=self.family)
+        PantryStock.objects.create(family=self.family, ingredient=self.flour, qty_available=Decimal("1.0"), unit="kg")
+        self.client.force_authenticate(user=self.user)
+
+    def _order(self, order_status, *used):
+        order = Order.objects.create(family=self.family, cuisine=self.cake, created_by=self.user, status=order_status)
+        for ingredient, quantity, unit in used:
+            OrderItemIngredient.objects.create(order=order, ingredient=ingredient, quantity=quantity, unit=unit)
+        return order
+
+    def test_prep_list_totals_and_shortfalls(self):
+        """Test open orders are summed in the pantry unit and compared with the stock"""
+        self._order("NEW", (self.flour, Decimal("400"), "g"), (self.egg, Decimal("2"), "pieces"))
+        self._order("COOKING", (self.flour, Decimal("0.8"), "kg"), (self.egg, Decimal("1"), "pieces"))
+        self._order("DONE", (self.flour, Decimal("900"), "g"))
+
+        response = self.client.get("/api/orders/prep-list/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        items = {item["ingredient_name"]: item for item in response.json()}
+
+        self.assertEqual(items["Flour"]["unit"], "kg")
+        self.assertEqual(items["Flour"]["qty_required"], "1.20")
+        self.assertEqual(items["Flour"]["qty_available"], "1.00")
+        self.assertEqual(items["Flour"]["shortfall"], "0.20")
+        self.assertTrue(items["Flour"]["is_short"])
+        self.assertEqual(items["Egg"]["qty_required"], "3.00")
+        self.assertEqual(items["Egg"]["shortfall"], "3.00")
+
+    def test_prep_list_query_count_is_constant(self):
+        """Test the prep list costs the same queries for few or many open orders"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self._order("NEW", (self.flour, Decimal("100"), "g"))
+        with CaptureQueriesContext(connection) as few_orders:
+            self.client.get("/api/orders/prep-list/")
+
+        for index in range(30):
+            ingredient = Ingredient.objects.create(name=f"Spice {index}")
+            self._order("NEW", (self.flour, Decimal("10"), "g"), (ingredient, Decimal("1"), "g"))
+        with CaptureQueriesContext(connection) as many_orders:
+            response = self.client.get("/api/orders/prep-list/")
+
+        self.assertEqual(len(response.json()), 31)
+        self.assertEqual(len(many_orders), len(few_orders))
+
+
+class PantryReservationTests(APITestCase):
+    """Test the pantry reservation ledger of open orders"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.flour = Ingredient.objects.create(name="Flour")
+        self.stock = PantryStock.objects.create(
+            family=self.family, ingredient=self.flour, qty_available=Decimal("1.0"), unit="kg"
+        )
+        self.bread = Cuisine.objects.create(name="Bread", default_time_min=60, created_by=self.user, family=self.family)
+        RecipeIngredient.objects.create(cuisine=self.bread, ingredient=self.flour, quantity=Decimal("400"), unit="g")
+        self.client.force_authenticate(user=self.user)
+
+    def _place_order(self):
+        response = self.client.post("/api/orders/", {"family_id": self.family.id, "cuisine_id": self.bread.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()["id"]
+
+    def _assert_stock(self, qty_available, qty_reserved, servings_possible):
+        self.stock.refresh_from_db()
+        self.bread.availability.refresh_from_db()
+        self.assertEqual(self.stock.qty_available, Decimal(qty_available))
+        self.assertEqual(self.stock.qty_reserved, Decimal(qty_reserved))
+        self.assertEqual(self.bread.availability.servings_possible, servings_possible)
+
+    def test_orders_reserve_and_completion_deducts(self):
+        """Test open orders hold stock for the menu and DONE turns the hold into a deduction"""
+        self._assert_stock("1.0", "0", 2)
+
+        order_id = self._place_order()
+        self._assert_stock("1.0", "0.4", 1)
+        self._place_order()
+        self._assert_stock("1.0", "0.8", 0)
+        self.assertFalse(self.client.get("/api/menu/").json()["results"][0]["is_available"])
+
+        self.client.patch(f"/api/orders/{order_id}/update_status/", {"status": "COOKING"})
+        self._assert_stock("1.0", "0.8", 0)
+        self.client.patch(f"/api/orders/{order_id}/update_status/", {"status": "DONE"})
+        self._assert_stock("0.6", "0.4", 0)
+        self.assertFalse(PantryReservation.objects.filter(order_id=order_id).exists())
+
+    def test_cancel_and_delete_release_reservations(self):
+        """Test cancelled and deleted orders give their reserved quantities back"""
+        cancelled_id = self._place_order()
+        deleted_id = self._place_order()
+        self._assert_stock("1.0", "0.8", 0)
+
+        response = self.client.patch(f"/api/orders/{cancelled_id}/update_status/", {"status": "CANCELLED"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self._assert_stock("1.0", "0.4", 1)
+
+        response = self.client.delete(f"/api/orders/{deleted_id}/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self._assert_stock("1.0", "0", 2)
+        self.assertFalse(PantryReservation.objects.exists())
+
+    def test_batch_orders_reserve(self):
+        """Test orders placed in a batch reserve their ingredients too"""
+        entries = [{"cuisine_id": self.bread.id}] * 3
+        response = self.client.post("/api/orders/batch/", {"family_id": self.family.id, "orders": entries}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self._assert_stock("1.0", "1.2", 0)
+        self.assertEqual(PantryReservation.objects.count(), 3)
+
+    def test_pantry_edit_keeps_concurrent_reservation(self):
+        """Test editing a pantry item does not write back the reserved total it read before an order reserved stock"""
+        stale = PantryStock.objects.get(pk=self.stock.pk)
+        self._place_order()
+
+        with patch("core.views.PantryStockViewSet.get_object", return_value=stale):
+            response = self.client.patch(f"/api/pantry-stock/{self.stock.id}/", {"qty_available": "2.0"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(response.data["qty_reserved"]), Decimal("0.4"))
+        self._assert_stock("2.0", "0.4", 4)
+
+    def test_rebuild_reservations_command(self):
+        """Test the management command reports drifted reserved totals and repairs them from the reservations"""
+        from io import StringIO
+
+        from django.core.management import CommandError, call_command
+
+        self._place_order()
+        PantryStock.objects.filter(pk=self.stock.pk).update(qty_reserved=Decimal("0"))
+
+        with self.assertRaisesMessage(CommandError, "1 pantry items have drifted reserved totals"):
+            call_command("rebuild_reservations", "--check", stdout=StringIO())
+
+        call_command("rebuild_reservations", stdout=StringIO())
+        self._assert_stock("1.0", "0.4", 1)
+
+        output = StringIO()
+        call_command("rebuild_reservations", "--check", stdout=output)
+        self.assertIn("No drift found", output.getvalue())
+
+
+class OrderStateMachineTests(APITestCase):
+    """Test order status transitions and optimistic concurrency"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        cuisine = Cuisine.objects.create(name="Stew", default_time_min=90, created_by=self.user, family=self.family)
+        self.order = Order.objects.create(family=self.family, cuisine=cuisine, created_by=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def _update_status(self, new_status, **extra):
+        return self.client.patch(f"/api/orders/{self.order.id}/update_status/", {"status": new_status, **extra})
+
+    def test_only_allowed_transitions(self):
+        """Test orders move NEW -> COOKING -> DONE and never back"""
+        self.assertEqual(self._update_status("DONE").status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self._update_status("COOKING")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["version"], 1)
+        self.assertEqual(self._update_status("NEW").status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self._update_status("DONE")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["version"], 2)
+        for new_status in ["NEW", "COOKING", "CANCELLED"]:
+            self.assertEqual(self._update_status(new_status).status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Regular updates cannot bypass the state machine
+        self.client.patch(f"/api/orders/{self.order.id}/", {"status": "NEW"})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "DONE")
+
+    def test_stale_version_conflicts(self):
+        """Test a device updating from a stale version gets 409 instead of overwriting"""
+        self.assertEqual(self._update_status("COOKING", version=0).status_code, status.HTTP_200_OK)
+
+        response = self._update_status("CANCELLED", version=0)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()["status"], "COOKING")
+        self.assertEqual(response.json()["version"], 1)
+
+        self.assertEqual(self._update_status("DONE", version=1).status_code, status.HTTP_200_OK)
+
+    def test_concurrent_update_conflicts(self):
+        """Test an update racing between the read and the conditional write gets 409"""
+        # Another device completes the change after this request read the order
+        Order.objects.filter(pk=self.order.pk).update(status="COOKING", version=1)
+        with patch("core.views.OrderViewSet.get_object", return_value=self.order):
+            response = self._update_status("CANCELLED")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "COOKING")
+
+    def test_update_writes_only_status_columns(self):
+        """Test the status update does not rewrite other columns"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            self._update_status("COOKING")
+        updates = [query["sql"] for query in queries if query["sql"].startswith('UPDATE "core_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn("scheduled_for", updates[0])
+
+    def test_edit_keeps_concurrent_status_change(self):
+        """Test editing an order does not write back the status it read before another device completed it"""
+        scheduled_for = timezone.now() + timedelta(days=1)
+        deducted_at = timezone.now()
+        Order.objects.filter(pk=self.order.pk).update(status="DONE", version=2, stock_deducted_at=deducted_at)
+        with patch("core.views.OrderViewSet.get_object", return_value=self.order):
+            response = self.client.patch(f"/api/orders/{self.order.id}/", {"scheduled_for": scheduled_for.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["status"], response.data["version"]), ("DONE", 2))
+
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ("DONE", 2))
+        self.assertEqual(self.order.stock_deducted_at, deducted_at)
+        self.assertEqual(self.order.scheduled_for, scheduled_for)
+
+
+class OrderCompletionPipelineTests(APITestCase):
+    """Test the background side effects of completing an order"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.milk = Ingredient.objects.create(name="Milk")
+        PantryStock.objects.create(family=self.family, ingredient=self.milk, qty_available=Decimal("1.0"), unit="l")
+        LowStockThreshold.objects.create(family=self.family, ingredient=self.milk, threshold_qty=Decimal("500"), unit="ml")
+        cuisine = Cuisine.objects.create(name="Pudding", default_time_min=30, created_by=self.user, family=self.family)
+        self.order = Order.objects.create(family=self.family, cuisine=cuisine, created_by=self.user, status="COOKING")
+        OrderItemIngredient.objects.create(order=self.order, ingredient=self.milk, quantity=Decimal("600"), unit="ml")
+        self.client.force_authenticate(user=self.user)
+
+    def test_side_effects_run_after_commit(self):
+        """Test alerts, shopping list and notification only run once the completion is committed"""
+        with patch("core.tasks.send_order_update") as send_order_update:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.patch(f"/api/orders/{self.order.id}/update_status/", {"status": "DONE"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(Alert.objects.exists())
+            send_order_update.assert_not_called()
+
+            # Runs the chain eagerly, as CELERY_TASK_ALWAYS_EAGER is on in tests
+            for callback in callbacks:
+                callback()
+
+        alert = Alert.objects.get(family=self.family, ingredient=self.milk)
+        self.assertEqual(alert.alert_type, "LOW_STOCK")
+        self.assertTrue(ShoppingList.objects.filter(family=self.family, ingredient=self.milk).exists())
+        send_order_update.assert_called_once()
+        self.assertEqual(send_order_update.call_args.args[1]["status"], "DONE")
+
+    def test_other_transitions_only_notify(self):
+        """Test starting to cook sends the update in the background without touching alerts"""
+        self.order.status = "NEW"
+        self.order.save()
+
+        with patch("core.tasks.send_order_update") as send_order_update:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f"/api/orders/{self.order.id}/update_status/", {"status": "COOKING"})
+
+        send_order_update.assert_called_once()
+        self.assertFalse(Alert.objects.exists())
+
+
+class HistoryPaginationTests(APITestCase):
+    """Test the opt-in cursor pagination of order and alert history"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        cuisine = Cuisine.objects.create(name="Toast", default_time_min=5, created_by=self.user, family=self.family)
+        Order.objects.bulk_create(
+            Order(family=self.family, cuisine=cuisine, created_by=self.user, status="DONE") for _ in range(45)
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_cursor_pages_walk_the_whole_history(self):
+        """Test following cursor links returns every order once, newest first, without counting"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        seen = []
+        url = "/api/orders/?pagination=cursor"
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(url).json()
+            self.assertNotIn("count", page)
+            self.assertFalse(any("COUNT(" in query["sql"] for query in queries))
+            seen += [order["id"] for order in page["results"]]
+            url = page["next"]
+
+        expected = list(Order.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_numbers_remain_the_default(self):
+        """Test clients that do not opt in keep numbered pages with a count"""
+        page = self.client.get("/api/orders/?page=3").json()
+        self.assertEqual(page["count"], 45)
+        self.assertEqual(len(page["results"]), 5)
+
+        page = self.client.get("/api/alerts/?pagination=cursor").json()
+        self.assertEqual(page["results"], [])
+        self.assertNotIn("count", page)
+
+    def test_benchmark_command(self):
+        """Test the pagination benchmark reports both modes and leaves no data behind"""
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command("benchmark_order_pagination", orders=60, pages=[1, 3], repeat=1, stdout=out)
+
+        self.assertIn("Created 60 orders", out.getvalue())
+        self.assertEqual(len([line for line in out.getvalue().splitlines() if "queries" in line]), 2)
+        self.assertFalse(Family.objects.filter(name="Pagination benchmark").exists())
+
+
+class ScheduledOrderDispatchTests(APITestCase):
+    """Test scheduled orders are marked ready to cook when cooking has to start"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.cuisine = Cuisine.objects.create(name="Roast", default_time_min=60, created_by=self.user, family=self.family)
+        self.client.force_authenticate(user=self.user)
+
+    def _order(self, scheduled_in):
+        scheduled_for = timezone.now() + scheduled_in if scheduled_in is not None else None
+        return Order.objects.create(
+            family=self.family, cuisine=self.cuisine, created_by=self.user, scheduled_for=scheduled_for
+        )
+
+    def test_sweeper_dispatches_due_orders_once(self):
+        """Test only orders whose cooking time has come are marked READY and announced"""
+        from .tasks import dispatch_due_orders
+
+        due = self._order(timedelta(minutes=30))
+        later = self._order(timedelta(minutes=90))
+        unscheduled = self._order(None)
+
+        with patch("core.tasks.send_start_cooking") as send_start_cooking:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = dispatch_due_orders()
+            self.assertEqual(result, "Dispatched 1 scheduled orders")
+            self.assertEqual(dispatch_due_orders(), "Dispatched 0 scheduled orders")
+
+        send_start_cooking.assert_called_once()
+        family_id, orders_data = send_start_cooking.call_args.args
+        self.assertEqual(family_id, self.family.id)
+        self.assertEqual([data["id"] for data in orders_data], [due.id])
+
+        due.refresh_from_db()
+        self.assertEqual(due.status, "READY")
+        self.assertEqual(due.version, 1)
+        self.assertEqual(Order.objects.get(pk=later.pk).status, "NEW")
+        self.assertEqual(Order.objects.get(pk=unscheduled.pk).status, "NEW")
+
+    def test_sweeper_is_not_starved_by_orders_not_yet_due(self):
+        """Test a due long-cooking order is dispatched ahead of a full batch of short ones that are not due"""
+        from .tasks import dispatch_due_orders
+
+        snack = Cuisine.objects.create(name="Snack", default_time_min=5, created_by=self.user, family=self.family)
+        for _ in range(3):
+            Order.objects.create(
+                family=self.family, cuisine=snack, created_by=self.user, scheduled_for=timezone.now() + timedelta(minutes=20)
+            )
+        roast = self._order(timedelta(minutes=50))
+
+        with patch("core.tasks.DISPATCH_BATCH_SIZE", 2), patch("core.tasks.send_start_cooking"):
+            result = dispatch_due_orders()
+        self.assertEqual(result, "Dispatched 1 scheduled orders")
+        self.assertEqual(Order.objects.get(pk=roast.pk).status, "READY")
+        self.assertFalse(Order.objects.filter(cuisine=snack).exclude(status="NEW").exists())
+
+    def test_dispatch_task_queued_for_cooking_time(self):
+        """Test creating a scheduled order queues its dispatch for the time cooking has to start"""
+        scheduled_for = timezone.now() + timedelta(hours=3)
+        with patch("core.tasks.dispatch_scheduled_order.apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    "/api/orders/",
+                    {"family_id": self.family.id, "cuisine_id": self.cuisine.id, "scheduled_for": scheduled_for.isoformat()},
+                )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        apply_async.assert_called_once_with((response.data["id"],), eta=scheduled_for - timedelta(minutes=60))
+
+    def test_dispatch_task_waits_for_cooking_time(self):
+        """Test a dispatch task running early leaves the order alone, and a due one can then be cooked"""
+        from .tasks import dispatch_scheduled_order
+
+        order = self._order(timedelta(hours=2))
+        self.assertEqual(dispatch_scheduled_order(order.pk), f"Order {order.pk} not due")
+        self.assertEqual(Order.objects.get(pk=order.pk).status, "NEW")
+
+        Order.objects.filter(pk=order.pk).update(scheduled_for=timezone.now() + timedelta(minutes=10))
+        self.assertEqual(dispatch_scheduled_order(order.pk), "Dispatched 1 scheduled orders")
+
+        response = self.client.patch(f"/api/orders/{order.id}/update_status/", {"status": "COOKING", "version": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "COOKING")
+
+
+class IncrementalAlertTests(APITestCase):
+    """Test alerts are re-evaluated as soon as pantry stock or thresholds change"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.flour = Ingredient.objects.create(name="Flour")
+        LowStockThreshold.objects.create(family=self.family, ingredient=self.flour, threshold_qty=Decimal("1"), unit="kg")
+        self.stock = PantryStock.objects.create(
+            family=self.family, ingredient=self.flour, qty_available=Decimal("2000"), unit="g"
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _patch_stock(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f"/api/pantry-stock/{self.stock.id}/", data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_pantry_write_creates_and_resolves_alerts(self):
+        """Test an API pantry update creates alerts right away and a restock resolves them"""
+        self._patch_stock(qty_available="800", best_before=str(date.today() - timedelta(days=1)))
+        self.assertEqual(
+            set(Alert.objects.filter(is_resolved=False).values_list("alert_type", flat=True)), {"LOW_STOCK", "EXPIRED"}
+        )
+
+        self._patch_stock(qty_available="1500", best_before=str(date.today() + timedelta(days=30)))
+        self.assertFalse(Alert.objects.filter(is_resolved=False).exists())
+        self.assertEqual(Alert.objects.filter(resolved_at__isnull=False).count(), 2)
+
+    def test_restock_within_warning_window_replaces_expired_alert(self):
+        """Test a restock expiring in two days resolves the EXPIRED alert and raises EXPIRING_SOON instead"""
+        self._patch_stock(best_before=str(date.today()))
+        self.assertEqual(list(Alert.objects.filter(is_resolved=False).values_list("alert_type", flat=True)), ["EXPIRED"])
+
+        self._patch_stock(best_before=str(date.today() + timedelta(days=2)))
+        self.assertEqual(list(Alert.objects.filter(is_resolved=False).values_list("alert_type", flat=True)), ["EXPIRING_SOON"])
+
+    def test_threshold_change_evaluates_alerts(self):
+        """Test raising a threshold above the stock creates the alert without waiting for the daily check"""
+        threshold = LowStockThreshold.objects.get(family=self.family, ingredient=self.flour)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f"/api/low-stock-thresholds/{threshold.id}/", {"threshold_qty": "3"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(Alert.objects.filter(alert_type="LOW_STOCK", is_resolved=False).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            threshold.delete()
+        self.assertFalse(Alert.objects.filter(is_resolved=False).exists())
+
+    def test_order_deduction_evaluates_alerts(self):
+        """Test completing an order evaluates its alerts as the first link of the completion chain"""
+        from .tasks import order_completed_pipeline
+
+        cuisine = Cuisine.objects.create(name="Bread", default_time_min=60, created_by=self.user, family=self.family)
+        order = Order.objects.create(family=self.family, cuisine=cuisine, created_by=self.user, status="COOKING")
+        OrderItemIngredient.objects.create(order=order, ingredient=self.flour, quantity=Decimal("1.5"), unit="kg")
+
+        with patch("core.tasks.evaluate_pantry_alerts.delay") as evaluate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f"/api/orders/{order.id}/update_status/", {"status": "DONE"})
+        evaluate.assert_not_called()
+
+        first, refresh, _ = order_completed_pipeline(order).tasks
+        self.assertEqual(first.task, "core.tasks.evaluate_pantry_alerts")
+        self.assertEqual(first.args, (self.family.id, [self.flour.id]))
+        self.assertEqual(refresh.task, "core.tasks.refresh_shopping_list_for_order")
+
+    def test_order_completion_evaluates_alerts_once(self):
+        """Test completing an order runs the low stock check once and lists the ingredient for shopping"""
+        from . import tasks
+
+        cuisine = Cuisine.objects.create(name="Bread", default_time_min=60, created_by=self.user, family=self.family)
+        order = Order.objects.create(family=self.family, cuisine=cuisine, created_by=self.user, status="COOKING")
+        OrderItemIngredient.objects.create(order=order, ingredient=self.flour, quantity=Decimal("1.5"), unit="kg")
+
+        with patch("core.tasks._create_low_stock_alerts", wraps=tasks._create_low_stock_alerts) as create_alerts:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f"/api/orders/{order.id}/update_status/", {"status": "DONE"})
+        create_alerts.assert_called_once()
+        self.assertTrue(Alert.objects.filter(alert_type="LOW_STOCK", is_resolved=False).exists())
+        self.assertTrue(ShoppingList.objects.filter(family=self.family, ingredient=self.flour).exists())
+
+    def test_restock_resolves_alerts_and_shopping_items_in_write_transaction(self):
+        """Test a restock closes the alert and its shopping list item without waiting for a commit"""
+        alert = Alert.objects.create(family=self.family, ingredient=self.flour, alert_type="LOW_STOCK", message="Low")
+        item = ShoppingList.objects.create(family=self.family, ingredient=self.flour, qty_needed=Decimal("1"), unit="kg")
+        sugar = Ingredient.objects.create(name="Sugar")
+        manual_item = ShoppingList.objects.create(family=self.family, ingredient=sugar, qty_needed=Decimal("1"), unit="kg")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(f"/api/pantry-stock/{self.stock.id}/", {"qty_available": "5000"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Only the alert evaluation and the menu cache bump are left for after the commit
+        self.assertEqual(len(callbacks), 2)
+
+        alert.refresh_from_db()
+        item.refresh_from_db()
+        manual_item.refresh_from_db()
+        self.assertTrue(alert.is_resolved)
+        self.assertTrue(item.is_resolved)
+        self.assertFalse(manual_item.is_resolved)
+
+    def test_shopping_item_kept_while_another_alert_is_open(self):
+        """Test a restock leaves the shopping item open if the stock is still expired"""
+        self.stock.best_before = date.today() - timedelta(days=1)
+        self.stock.qty_available = Decimal("500")
+        self.stock.save()
+        Alert.objects.create(family=self.family, ingredient=self.flour, alert_type="LOW_STOCK", message="Low")
+        Alert.objects.create(family=self.family, ingredient=self.flour, alert_type="EXPIRED", message="Expired")
+        item = ShoppingList.objects.create(family=self.family, ingredient=self.flour, qty_needed=Decimal("1"), unit="kg")
+
+        self._patch_stock(qty_available="5000")
+
+        item.refresh_from_db()
+        self.assertFalse(item.is_resolved)
+        self.assertEqual(list(Alert.objects.filter(is_resolved=False).values_list("alert_type", flat=True)), ["EXPIRED"])
+
+
+class ConsumptionForecastTests(APITestCase):
+    """Test consumption rates rolled up from completed orders and the forecasts built on them"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.family = Family.objects.create(name="Test Family")
+        FamilyMember.objects.create(user=self.user, family=self.family, role="chef")
+        self.flour = Ingredient.objects.create(name="Flour")
+        self.stock = PantryStock.objects.create(
+            family=self.family, ingredient=self.flour, qty_available=Decimal("5"), unit="kg"
+        )
+        self.cuisine = Cuisine.objects.create(name="Bread", default_time_min=60, created_by=self.user, family=self.family)
+        self.client.force_authenticate(user=self.user)
+
+    def _complete_order(self, quantity, unit):
+        order = Order.objects.create(family=self.family, cuisine=self.cuisine, created_by=self.user, status="COOKING")
+        OrderItemIngredient.objects.create(order=order, ingredient=self.flour, quantity=quantity, unit=unit)
+        response = self.client.patch(f"/api/orders/{order.id}/update_status/", {"status": "DONE"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_completed_orders_update_one_decayed_total(self):
+        """Test each completed order decays the stored total and adds its usage in the pantry unit"""
+        from .forecast import record_usage
+
+        self._complete_order(Decimal("500"), "g")
+        rate = ConsumptionRate.objects.get(family=self.family, ingredient=self.flour)
+        self.assertEqual((rate.decayed_usage, rate.unit), (Decimal("0.5"), "kg"))
+
+        # One half-life later the old usage counts half
+        record_usage(self.family.id, {self.flour.id: (Decimal("1"), "kg", None)}, now=rate.updated_at + timedelta(days=14))
+        rate.refresh_from_db()
+        self.assertEqual(rate.decayed_usage, Decimal("1.25"))
+        self.assertEqual(ConsumptionRate.objects.count(), 1)
+
+    @override_settings(CONSUMPTION_HALF_LIFE_DAYS=math.log(2))
+    def test_forecast_projects_stock_out(self):
+        """Test the forecast endpoint divides the free stock by the daily rate"""
+        # With a half-life of ln 2 days the daily rate equals the decayed total
+        self._complete_order(Decimal("1"), "kg")
+
+        response = self.client.get("/api/pantry-stock/forecast/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item = response.data[0]
+        self.assertEqual(Decimal(item["qty_available"]), Decimal("4"))
+        self.assertEqual(Decimal(item["daily_rate"]), Decimal("1"))
+        self.assertEqual(Decimal(item["days_left"]), Decimal("4"))
+        self.assertEqual(item["stock_out_date"], str((timezone.now() + timedelta(days=4)).date()))
+
+    def test_forecast_without_recent_usage(self):
+        """Test usage decayed close to zero projects no stock-out instead of a date out of range"""
+        PantryStock.objects.filter(pk=self.stock.pk).update(qty_available=Decimal("5000"), unit="g")
+        ConsumptionRate.objects.create(
+            family=self.family,
+            ingredient=self.flour,
+            decayed_usage=Decimal("200"),
+            unit="g",
+            updated_at=timezone.now() - timedelta(days=220),
+        )
+
+        response = self.client.get("/api/pantry-stock/forecast/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data[0]["days_left"])
+        self.assertIsNone(response.data[0]["stock_out_date"])
+
+    @override_settings(CONSUMPTION_HALF_LIFE_DAYS=math.log(2), SHOPPING_FORECAST_DAYS=7)
+    def test_shopping_quantity_covers_forecast_horizon(self):
+        """Test low stock is topped up to the threshold plus a week of forecast usage"""
+        from .tasks import generate_shopping_lists
+
+        self._complete_order(Decimal("4500"), "g")
+        LowStockThreshold.objects.create(family=self.family, ingredient=self.flour, threshold_qty=Decimal("1000"), unit="g")
+        Alert.objects.create(family=self.family, ingredient=self.flour, alert_type="LOW_STOCK", message="Low stock")
+
+        generate_shopping_lists()
+
+        item = ShoppingList.objects.get(family=self.family, ingredient=self.flour)
+        # 1000 g threshold + 7 days * 4500 g/day - 500 g in stock
+        self.assertEqual((item.qty_needed, item.unit), (Decimal("32000"), "g"))
@@ -0,0 +1,119 @@
+"""
+Unit conversion
+
+Units belong to a dimension (mass, volume or count) and are defined by their
+factor to the dimension's base unit. Factors between every pair of units of
+the same dimension are compiled once at import time, so converting inside hot
+loops is a dictionary lookup and a multiplication. Mass and volume can be
+converted into each other when the ingredient has a density.
+"""
+
+from decimal import Decimal
+
+MASS = "mass"
+VOLUME = "volume"
+COUNT = "count"
+
+# Unit name -> (dimension, factor to the base unit: gram, millilitre or piece)
+UNITS = {
+    # Mass
+    "mg": (MASS, "0.001"),
+    "g": (MASS, "1"),
+    "gram": (MASS, "1"),
+    "grams": (MASS, "1"),
+    "kg": (MASS, "1000"),
+    "kilogram": (MASS, "1000"),
+    "kilograms": (MASS, "1000"),
+    "oz": (MASS, "28.349523125"),
+    "ounce": (MASS, "28.349523125"),
+    "ounces": (MASS, "28.349523125"),
+    "lb": (MASS, "453.59237"),
+    "lbs": (MASS, "453.59237"),
+    "pound": (MASS, "453.59237"),
+    "pounds": (MASS, "453.59237"),
+    # Volume
+    "ml": (VOLUME, "1"),
+    "millilitre": (VOLUME, "1"),
+    "milliliter": (VOLUME, "1"),
+    "millilitres": (VOLUME, "1"),
+    "milliliters": (VOLUME, "1"),
+    "cl": (VOLUME, "10"),
+    "dl": (VOLUME, "100"),
+    "l": (VOLUME, "1000"),
+    "litre": (VOLUME, "1000"),
+    "liter": (VOLUME, "1000"),
+    "litres": (VOLUME, "1000"),
+    "liters": (VOLUME, "1000"),
+    "tsp": (VOLUME, "4.92892159375"),
+    "teaspoon": (VOLUME, "4.92892159375"),
+    "teaspoons": (VOLUME, "4.92892159375"),
+    "tbsp": (VOLUME, "14.78676478125"),
+    "tablespoon": (VOLUME, "14.78676478125"),
+    "tablespoons": (VOLUME, "14.78676478125"),
+    "cup": (VOLUME, "236.5882365"),
+    "cups": (VOLUME, "236.5882365"),
+    # Count
+    "piece": (COUNT, "1"),
+    "pieces": (COUNT, "1"),
+    "pc": (COUNT, "1"),
+    "pcs": (COUNT, "1"),
+    "unit": (COUNT, "1"),
+    "units": (COUNT, "1"),
+    "each": (COUNT, "1"),
+    "ea": (COUNT, "1"),
+    "dozen": (COUNT, "12"),
+}
+
+
+def _compile(units):
+    """Build the base-unit table and the pairwise factor table for same-dimension units"""
+    base = {name: (dimension, Decimal(factor)) for name, (dimension, factor) in units.items()}
+    factors = {
+        (source, target): source_factor / target_factor
+        for source, (source_dimension, source_factor) in base.items()
+        for target, (target_dimension, target_factor) in base.items()
+        if source_dimension == target_dimension
+    }
+    return base, factors
+
+
+_BASE, _FACTORS = _compile(UNITS)
+
+
+def normalize_unit(unit):
+    """Return the canonical lookup key for a unit string"""
+    return unit.strip().lower()
+
+
+def conversion_factor(from_unit, to_unit, density=None):
+    """
+    Return the factor converting quantities from one unit to another.
+
+    Unknown units only convert to the exact same string. Mass and volume are
+    converted through the density (grams per millilitre) when one is given.
+    Returns None when the units cannot be converted.
+    """
+    if from_unit == to_unit:
+        return Decimal(1)
+
+    source = normalize_unit(from_unit)
+    target = normalize_unit(to_unit)
+    factor = _FACTORS.get((source, target))
+    if factor is not None or not density:
+        return factor
+
+    source_dimension, source_factor = _BASE.get(source, (None, None))
+    target_dimension, target_factor = _BASE.get(target, (None, None))
+    if source_dimension == VOLUME and target_dimension == MASS:
+        return source_factor * density / target_factor
+    if source_dimension == MASS and target_dimension == VOLUME:
+        return source_factor / density / target_factor
+    return None
+
+
+def convert(quantity, from_unit, to_unit, density=None):
+    """Convert a quantity between units, returning None when they are incompatible"""
+    factor = conversion_factor(from_unit, to_unit, density)
+    if factor is None:
+        return None
+    return quantity * factor
@@ -8,6 +8,7 @@ router.register(r"users", views.UserViewSet)
 router.register(r"families", views.FamilyViewSet)
 router.register(r"family-members", views.FamilyMemberViewSet)
 router.register(r"ingredients", views.IngredientViewSet)
+router.register(r"ingredient-substitutions", views.IngredientSubstitutionViewSet)
 router.register(r"cuisines", views.CuisineViewSet)
 router.register(r"recipe-ingredients", views.RecipeIngredientViewSet)
 router.register(r"pantry-stock", views.PantryStockViewSet)
@@ -20,6 +20,40 @@ def send_order_update(family_id, order_data):
             pass
 
 
+def send_orders_created(family_id, orders_data):
+    """Send one coalesced update for several new orders to the WebSocket group"""
+    # Skip WebSocket notifications during testing
+    if settings.TESTING:
+        return
+
+    channel_layer = get_channel_layer()
+    if channel_layer:
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f"orders_{family_id}", {"type": "order_update", "message": {"action": "orders_created", "orders": orders_data}}
+            )
+        except Exception:
+            # Silently fail if Redis is not available (e.g., during testing)
+            pass
+
+
+def send_start_cooking(family_id, orders_data):
+    """Tell the WebSocket group that scheduled orders should be started now"""
+    # Skip WebSocket notifications during testing
+    if settings.TESTING:
+        return
+
+    channel_layer = get_channel_layer()
+    if channel_layer:
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f"orders_{family_id}", {"type": "order_update", "message": {"action": "start_cooking", "orders": orders_data}}
+            )
+        except Exception:
+            # Silently fail if Redis is not available (e.g., during testing)
+            pass
+
+
 def send_shopping_list_update(family_id, shopping_item_data):
     """Send shopping list update to WebSocket group"""
     # Skip WebSocket notifications during testing
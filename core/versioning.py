@@ -0,0 +1,82 @@
+"""
+Per-family data versions used for conditional GET requests
+
+Writes bump the version of every resource they change, and list and detail
+views derive a weak ETag from the versions of the requesting user's families.
+A client revalidating with If-None-Match gets a 304 without the queryset or
+serializer ever running.
+"""
+
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import FamilyDataVersion, FamilyMember
+
+
+def bump_versions(family_id, *resources):
+    """Increment the version of the given resources for one family"""
+    FamilyDataVersion.objects.bulk_create(
+        [FamilyDataVersion(family_id=family_id, resource=resource) for resource in resources], ignore_conflicts=True
+    )
+    FamilyDataVersion.objects.filter(family_id=family_id, resource__in=resources).update(version=F("version") + 1)
+
+
+def bump_all_versions(*resources):
+    """Increment the version of the given resources for every family, for changes to shared data"""
+    FamilyDataVersion.objects.filter(resource__in=resources).update(version=F("version") + 1)
+
+
+def get_user_versions(user, resource):
+    """Return [(family_id, version)] for the families a user belongs to, in one query"""
+    version = FamilyDataVersion.objects.filter(family=OuterRef("family"), resource=resource).values("version")[:1]
+    return list(
+        FamilyMember.objects.filter(user=user)
+        .annotate(version=Coalesce(Subquery(version), Value(0)))
+        .order_by("family_id")
+        .values_list("family_id", "version")
+    )
+
+
+def _strip_weak(etag):
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+class VersionedETagMixin:
+    """
+    Add weak ETags to list and retrieve, answering matching If-None-Match with 304.
+
+    Views set etag_resource to the FamilyDataVersion resource their data
+    depends on.
+    """
+
+    etag_resource = None
+
+    def get_etag(self, request):
+        versions = "-".join(
+            f"{family_id}.{version}" for family_id, version in get_user_versions(request.user, self.etag_resource)
+        )
+        return f'W/"{self.etag_resource}-{request.accepted_renderer.format}-{versions}"'
+
+    def _conditional_response(self, request, handler, *args, **kwargs):
+        etag = self.get_etag(request)
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            candidates = parse_etags(if_none_match)
+            if "*" in candidates or _strip_weak(etag) in {_strip_weak(candidate) for candidate in candidates}:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+            # Let browsers keep the body but revalidate it on every use
+            response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_response(request, super().retrieve, *args, **kwargs)
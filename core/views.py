@@ -1,17 +1,25 @@
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q, prefetch_related_objects
 from django.http import JsonResponse
 from django.shortcuts import render
 from django.utils import timezone
-from rest_framework import permissions, viewsets
+from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 
+from . import menu_cache
+from .availability import compute_menu_status
+from .forecast import forecast_pantry
+from .menu_cache import MenuCacheMixin
 from .models import (
     Alert,
     Cuisine,
     Family,
     FamilyMember,
     Ingredient,
+    IngredientSubstitution,
     LowStockThreshold,
     Order,
     OrderItemIngredient,
@@ -19,21 +27,35 @@ from .models import (
     RecipeIngredient,
     ShoppingList,
 )
+from .pagination import OptionalCursorPaginationMixin
+from .pantry import (
+    compute_prep_list,
+    deduct_order_ingredients,
+    release_order_reservations,
+    reserve_order_ingredients,
+)
 from .serializers import (
     AlertSerializer,
     CuisineSerializer,
     FamilyMemberSerializer,
     FamilySerializer,
     IngredientSerializer,
+    IngredientSubstitutionSerializer,
     LowStockThresholdSerializer,
     MenuCuisineSerializer,
+    OrderBatchSerializer,
     OrderSerializer,
+    PantryForecastItemSerializer,
     PantryStockSerializer,
+    PrepListItemSerializer,
     RecipeIngredientSerializer,
     ShoppingListSerializer,
     UserSerializer,
 )
-from .utils import send_order_update
+from .signals import family_data_changed
+from .tasks import notify_order_update, order_completed_pipeline, schedule_order_dispatch
+from .utils import send_order_update, send_orders_created
+from .versioning import VersionedETagMixin
 
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
@@ -91,6 +113,42 @@ class IngredientViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
+class IngredientSubstitutionViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet for managing ingredient substitutions
+    """
+
+    queryset = IngredientSubstitution.objects.all()
+    serializer_class = IngredientSubstitutionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        # Users can see global substitutions and those of their families
+        user_families = FamilyMember.objects.filter(user=self.request.user).values_list("family", flat=True)
+        return IngredientSubstitution.objects.filter(Q(family__isnull=True) | Q(family__in=user_families))
+
+    def _check_scope(self, family_id):
+        # Global substitutions apply to every family, so only staff may change them
+        if family_id is None:
+            if not self.request.user.is_staff:
+                raise PermissionDenied("Only staff can manage substitutions shared by all families")
+        elif not FamilyMember.objects.filter(user=self.request.user, family_id=family_id).exists():
+            raise PermissionDenied("You are not a member of this family")
+
+    def perform_create(self, serializer):
+        self._check_scope(serializer.validated_data.get("family_id"))
+        serializer.save()
+
+    def perform_update(self, serializer):
+        self._check_scope(serializer.instance.family_id)
+        self._check_scope(serializer.validated_data.get("family_id", serializer.instance.family_id))
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        self._check_scope(instance.family_id)
+        instance.delete()
+
+
 class CuisineViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing cuisines/recipes
@@ -129,11 +187,12 @@ class RecipeIngredientViewSet(viewsets.ModelViewSet):
         return RecipeIngredient.objects.filter(cuisine__family__in=user_families)
 
 
-class PantryStockViewSet(viewsets.ModelViewSet):
+class PantryStockViewSet(VersionedETagMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing pantry stock
     """
 
+    etag_resource = "pantry"
     queryset = PantryStock.objects.all()
     serializer_class = PantryStockSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -143,52 +202,200 @@ class PantryStockViewSet(viewsets.ModelViewSet):
         user_families = FamilyMember.objects.filter(user=self.request.user).values_list("family", flat=True)
         return PantryStock.objects.filter(family__in=user_families)
 
+    # Alerts and shopping items closed by a restock are resolved in the same transaction as the write
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            stock = serializer.save()
+        # Saves leave qty_reserved alone; show the current total rather than the one read before the write
+        stock.refresh_from_db(fields=["qty_reserved"])
+
+    @action(detail=False, methods=["get"])
+    def forecast(self, request):
+        """Get the daily consumption rate and projected stock-out date of each pantry item"""
+        family_ids = FamilyMember.objects.filter(user=request.user).values_list("family_id", flat=True)
+        serializer = PantryForecastItemSerializer(forecast_pantry(list(family_ids)), many=True)
+        return Response(serializer.data)
+
 
-class MenuViewSet(viewsets.ReadOnlyModelViewSet):
+class MenuViewSet(VersionedETagMixin, MenuCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for viewing menu with availability information
     """
 
+    etag_resource = "menu"
     queryset = Cuisine.objects.all()
     serializer_class = MenuCuisineSerializer
+    AVAILABILITY_ORDERINGS = ["available", "-available"]
+    BOOLEAN_VALUES = {"true": True, "1": True, "false": False, "0": False}
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         # Users can only see cuisines from their families
         user_families = FamilyMember.objects.filter(user=self.request.user).values_list("family", flat=True)
-        return Cuisine.objects.filter(family__in=user_families)
-
-
-class OrderViewSet(viewsets.ModelViewSet):
+        queryset = (
+            Cuisine.objects.filter(family__in=user_families)
+            .select_related("created_by", "availability")
+            .prefetch_related("recipe_ingredients__ingredient")
+        )
+
+        available = self.request.query_params.get("available")
+        ordering = self.request.query_params.get("ordering")
+        if available is None and ordering not in self.AVAILABILITY_ORDERINGS:
+            return queryset
+
+        # Filter and order on the materialized availability table so pagination stays in SQL; every cuisine
+        # has a row, kept by the signal handlers and backfilled by migration 0018
+        queryset = queryset.annotate(available=F("availability__is_available"))
+
+        if available is not None:
+            if available.lower() not in self.BOOLEAN_VALUES:
+                raise ValidationError({"available": "Must be true or false."})
+            queryset = queryset.filter(available=self.BOOLEAN_VALUES[available.lower()])
+        if ordering in self.AVAILABILITY_ORDERINGS:
+            queryset = queryset.order_by(ordering, "name", "pk")
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        # Availability is read from the precomputed table; cuisines without a row
+        # yet are computed in one batch for the whole page
+        if args:
+            cuisines = args[0] if kwargs.get("many") else [args[0]]
+            missing = [cuisine for cuisine in cuisines if not hasattr(cuisine, "availability")]
+            kwargs.setdefault("context", self.get_serializer_context())
+            kwargs["context"]["menu_status"] = compute_menu_status(missing)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_cache_family_ids(self):
+        return list(FamilyMember.objects.filter(user=self.request.user).values_list("family_id", flat=True))
+
+    @action(detail=False, methods=["get"], url_path="cache-stats", permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """Get hit and miss counters of the serialized menu cache"""
+        return Response(menu_cache.get_stats())
+
+
+class OrderViewSet(VersionedETagMixin, OptionalCursorPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing orders
     """
 
+    etag_resource = "orders"
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         # Users can only see orders from their families
-        user_families = FamilyMember.objects.filter(user=self.request.user).values_list("family", flat=True)
-        return Order.objects.filter(family__in=user_families)
+        return (
+            self.filter_user_families(Order.objects.all())
+            # Prefetched rather than joined, so the page query stays a plain walk of the history index
+            .prefetch_related(
+                "created_by",
+                "family__familymember_set",
+                "cuisine__created_by",
+                "cuisine__family__familymember_set",
+                "cuisine__recipe_ingredients__ingredient",
+                "order_ingredients__ingredient",
+            ).order_by("-created_at", "-id")
+        )
 
     def perform_create(self, serializer):
-        # Create order and automatically create OrderItemIngredient snapshots
+        # Create the order and its OrderItemIngredient snapshots as one unit
+        with transaction.atomic():
+            order = serializer.save()
+            self._snapshot_recipes([order])
+            reserve_order_ingredients([order])
+
+            # Send WebSocket notification once the order is visible to other connections
+            payload = self._notification_payload(order)
+            transaction.on_commit(lambda: send_order_update(order.family_id, payload))
+            transaction.on_commit(lambda: schedule_order_dispatch([order]), robust=True)
+
+    def perform_update(self, serializer):
+        scheduled_for = serializer.instance.scheduled_for
         order = serializer.save()
-
-        # Create ingredient snapshots from the cuisine recipe
-        for recipe_ingredient in order.cuisine.recipe_ingredients.all():
-            OrderItemIngredient.objects.create(
-                order=order,
-                ingredient=recipe_ingredient.ingredient,
-                quantity=recipe_ingredient.quantity,
-                unit=recipe_ingredient.unit,
+        # A moved schedule needs a dispatch task for the new time
+        if order.scheduled_for != scheduled_for:
+            transaction.on_commit(lambda: schedule_order_dispatch([order]), robust=True)
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """Place several orders for one family at once"""
+        serializer = OrderBatchSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        family_id = serializer.validated_data["family_id"]
+
+        with transaction.atomic():
+            orders = Order.objects.bulk_create(
+                Order(
+                    family_id=family_id,
+                    cuisine_id=entry["cuisine_id"],
+                    scheduled_for=entry.get("scheduled_for"),
+                    created_by=request.user,
+                )
+                for entry in serializer.validated_data["orders"]
             )
+            self._snapshot_recipes(orders)
+            reserve_order_ingredients(orders)
+            # The bulk insert bypasses the Order post_save handler
+            family_data_changed(family_id, "orders")
+
+            payload = [self._notification_payload(order) for order in orders]
+            transaction.on_commit(lambda: send_orders_created(family_id, payload))
+            transaction.on_commit(lambda: schedule_order_dispatch(orders), robust=True)
+
+        return Response(self.get_serializer(orders, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["get"], url_path="prep-list")
+    def prep_list(self, request):
+        """Get the ingredients still needed by open orders next to the pantry stock"""
+        family_ids = FamilyMember.objects.filter(user=request.user).values_list("family_id", flat=True)
+        serializer = PrepListItemSerializer(compute_prep_list(list(family_ids)), many=True)
+        return Response(serializer.data)
 
-        # Send WebSocket notification
-        order_data = OrderSerializer(order, context={"request": self.request}).data
-        send_order_update(order.family.id, order_data)
+    def _snapshot_recipes(self, orders):
+        """Write the OrderItemIngredient snapshots of new orders, loading each recipe once"""
+        cuisines = (
+            Cuisine.objects.select_related("created_by", "family")
+            .prefetch_related("recipe_ingredients__ingredient", "family__familymember_set")
+            .in_bulk({order.cuisine_id for order in orders})
+        )
+        snapshots = []
+        for order in orders:
+            # The loaded cuisine is reused for the snapshots and the response
+            order.cuisine = cuisines[order.cuisine_id]
+            snapshots += [
+                OrderItemIngredient(
+                    order=order,
+                    ingredient=recipe_ingredient.ingredient,
+                    quantity=recipe_ingredient.quantity,
+                    unit=recipe_ingredient.unit,
+                )
+                for recipe_ingredient in order.cuisine.recipe_ingredients.all()
+            ]
+        OrderItemIngredient.objects.bulk_create(snapshots)
+        prefetch_related_objects(orders, "family__familymember_set", "order_ingredients__ingredient")
+
+    def _notification_payload(self, order):
+        """Build a compact order payload for WebSocket clients from data already in memory"""
+        return {
+            "id": order.id,
+            "family_id": order.family_id,
+            "cuisine_id": order.cuisine_id,
+            "cuisine_name": order.cuisine.name,
+            "created_by": order.created_by.username,
+            "status": order.status,
+            "scheduled_for": order.scheduled_for.isoformat() if order.scheduled_for else None,
+            "created_at": order.created_at.isoformat(),
+            "order_ingredients": [
+                {"ingredient_id": snapshot.ingredient_id, "quantity": str(snapshot.quantity), "unit": snapshot.unit}
+                for snapshot in order.order_ingredients.all()
+            ],
+        }
 
     @action(detail=True, methods=["patch"])
     def update_status(self, request, pk=None):
@@ -199,40 +406,51 @@ class OrderViewSet(viewsets.ModelViewSet):
         if new_status not in dict(Order.STATUS_CHOICES):
             return Response({"error": "Invalid status"}, status=400)
 
-        order.status = new_status
-        order.save()
-
-        # If status is DONE, deduct ingredients from pantry
-        if new_status == "DONE":
-            self._deduct_ingredients_from_pantry(order)
+        # Clients send the version they last saw; without one the version just read is used
+        try:
+            expected_version = int(request.data.get("version", order.version))
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid version"}, status=400)
+        if expected_version != order.version:
+            return self._conflict(order)
+        if not order.can_transition_to(new_status):
+            return Response({"error": f"Cannot change status from {order.status} to {new_status}"}, status=400)
+
+        with transaction.atomic():
+            # Only the status columns are written, and only if nobody changed the order meanwhile
+            now = timezone.now()
+            updated = Order.objects.filter(pk=order.pk, version=expected_version).update(
+                status=new_status, version=F("version") + 1, updated_at=now
+            )
+            if not updated:
+                return self._conflict(order)
+            order.status, order.version, order.updated_at = new_status, expected_version + 1, now
+            # The conditional update bypasses the Order post_save handler
+            family_data_changed(order.family_id, "orders")
+
+            # If status is DONE, turn the reservations into deductions from the pantry
+            if new_status == "DONE":
+                deduct_order_ingredients(order, evaluate_alerts=False)
+                # Alerts, shopping list and WebSocket fan-out run in the background once committed
+                pipeline = order_completed_pipeline(order)
+                transaction.on_commit(pipeline.apply_async, robust=True)
+            else:
+                if new_status == "CANCELLED":
+                    release_order_reservations([order])
+                transaction.on_commit(lambda: notify_order_update.delay(order.pk), robust=True)
 
-        # Send WebSocket notification
         serializer = self.get_serializer(order)
-        send_order_update(order.family.id, serializer.data)
-
         return Response(serializer.data)
 
-    def _deduct_ingredients_from_pantry(self, order):
-        """Deduct used ingredients from pantry when order is completed"""
-        for order_ingredient in order.order_ingredients.all():
-            try:
-                pantry_stock = PantryStock.objects.get(family=order.family, ingredient=order_ingredient.ingredient)
-
-                # Deduct the used quantity
-                pantry_stock.qty_available -= order_ingredient.quantity
+    def _conflict(self, order):
+        order.refresh_from_db(fields=["status", "version"])
+        return Response(
+            {"error": "Order was changed by someone else", "status": order.status, "version": order.version},
+            status=status.HTTP_409_CONFLICT,
+        )
 
-                # Ensure we don't go negative
-                if pantry_stock.qty_available < 0:
-                    pantry_stock.qty_available = 0
 
-                pantry_stock.save()
-
-            except PantryStock.DoesNotExist:
-                # If ingredient doesn't exist in pantry, skip
-                continue
-
-
-class AlertViewSet(viewsets.ModelViewSet):
+class AlertViewSet(OptionalCursorPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing alerts
     """
@@ -243,8 +461,7 @@ class AlertViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # Users can only see alerts from their families
-        user_families = FamilyMember.objects.filter(user=self.request.user).values_list("family", flat=True)
-        return Alert.objects.filter(family__in=user_families)
+        return self.filter_user_families(Alert.objects.all())
 
     @action(detail=True, methods=["patch"])
     def resolve(self, request, pk=None):
@@ -209,6 +209,33 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache
+# Shares the Redis instance with Channels and Celery; tests, or CACHE_URL=locmem://,
+# use a local in-memory cache instead
+CACHE_URL = os.getenv("CACHE_URL", REDIS_URL)
+if TESTING or CACHE_URL.startswith("locmem://"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+            "KEY_PREFIX": "familychef",
+        },
+    }
+
+# Seconds a serialized /api/menu/ payload stays cached
+MENU_CACHE_TIMEOUT = int(os.getenv("MENU_CACHE_TIMEOUT", "300"))
+
+# Days after which an order's ingredient usage counts half in consumption rates
+CONSUMPTION_HALF_LIFE_DAYS = float(os.getenv("CONSUMPTION_HALF_LIFE_DAYS", "14"))
+# Days of forecast consumption that generated shopping list quantities cover
+SHOPPING_FORECAST_DAYS = int(os.getenv("SHOPPING_FORECAST_DAYS", "7"))
+
 # Celery Configuration
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
@@ -216,13 +243,21 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+# Run tasks and chains in-process, without a broker; always on in tests
+CELERY_TASK_ALWAYS_EAGER = TESTING or os.getenv("CELERY_TASK_ALWAYS_EAGER", "False").lower() == "true"
+CELERY_TASK_EAGER_PROPAGATES = CELERY_TASK_ALWAYS_EAGER
 
 # Celery Beat Schedule (Periodic Tasks)
 CELERY_BEAT_SCHEDULE = {
     "daily-alert-check": {
         "task": "core.tasks.daily_alert_check",
+        # Safety net; alerts are re-evaluated when pantry stock or thresholds change
         "schedule": crontab(hour=9, minute=0),  # Run daily at 9:00 AM
     },
+    "dispatch-due-orders": {
+        "task": "core.tasks.dispatch_due_orders",
+        "schedule": crontab(),  # Every minute, as a fallback for lost dispatch tasks
+    },
 }
 
 # Django Allauth